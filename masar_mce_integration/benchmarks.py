@@ -0,0 +1,161 @@
+import os, json, random, shutil, tempfile, time
+from masar_mce_integration.tasks import split_json_memory_efficient
+from masar_mce_integration.utils import (
+    encode_pos_data_income_values, POS_DATA_INCOME_INSERT_FIELDS, POS_INSERT_CHUNK_SIZE
+)
+
+SPLIT_MODES = {
+    "two_pass": {},
+    "single_pass": {"single_pass": True},
+    "two_pass_raw": {"raw_passthrough": True},
+    "single_pass_raw": {"single_pass": True, "raw_passthrough": True},
+    "parallel": {"processes": min(os.cpu_count() or 1, 8)},
+    "parallel_raw": {"processes": min(os.cpu_count() or 1, 8), "raw_passthrough": True},
+}
+
+
+def make_sample_rows(invoices=10000, rows_per_invoice=5):
+    rows = []
+    for inv in range(1, invoices + 1):
+        for idx in range(1, rows_per_invoice + 1):
+            qty = random.randint(1, 5)
+            rate = round(random.uniform(0.1, 50), 3)
+            rows.append({
+                "invoice_pk": f"INV-{inv:09d}",
+                "row_pk": f"INV-{inv:09d}-{idx}",
+                "idx": idx,
+                "market_id": "101",
+                "market_description": "Sample Market",
+                "pos_no": "1",
+                "receipt_no": str(inv),
+                "current_year": "2025",
+                "date_timestamp": "2025-01-01T10:00:00",
+                "barcode": f"{random.randint(1, 99999):013d}",
+                "item_description": "Sample item",
+                "quantity": qty,
+                "rate": rate,
+                "amount": round(qty * rate, 3),
+                "payment_method": "Cash",
+                "receipt_type": "1",
+            })
+    return rows
+
+
+def make_sample_file(file_path, invoices=10000, rows_per_invoice=5, interleave=0.1):
+    """Write a synthetic POS dump shaped like the MCE export.
+
+    `interleave` is the share of rows that are emitted out of invoice order, so the
+    splitters have to deal with invoices whose rows are not contiguous.
+    """
+    rows = make_sample_rows(invoices, rows_per_invoice)
+    swaps = int(len(rows) * interleave)
+    for _ in range(swaps):
+        a = random.randrange(len(rows))
+        b = random.randrange(len(rows))
+        rows[a], rows[b] = rows[b], rows[a]
+    with open(file_path, "w", encoding="utf-8") as fh:
+        json.dump(rows, fh, ensure_ascii=False)
+    return file_path
+
+
+def benchmark_split(input_file=None, invoices_per_file=1000, repeat=3, modes=None):
+    """Time every splitter mode against the same input file.
+
+    bench --site <site> execute masar_mce_integration.benchmarks.benchmark_split --kwargs "{'input_file': '/path/to/dump.json'}"
+
+    Without `input_file` a synthetic dump is generated in a temp directory.
+    """
+    temp_input = None
+    if not input_file:
+        temp_input = tempfile.mkdtemp(prefix="mce_bench_input_")
+        input_file = make_sample_file(os.path.join(temp_input, "sample.json"))
+    size_mb = os.path.getsize(input_file) / (1024 * 1024)
+    results = {}
+    try:
+        for mode in (modes or SPLIT_MODES):
+            timings = []
+            split_count = 0
+            for _ in range(int(repeat)):
+                output_dir = tempfile.mkdtemp(prefix=f"mce_bench_{mode}_")
+                try:
+                    start = time.perf_counter()
+                    split_files = split_json_memory_efficient(
+                        input_file=input_file,
+                        output_dir=output_dir,
+                        invoices_per_file=int(invoices_per_file),
+                        **SPLIT_MODES[mode]
+                    )
+                    timings.append(time.perf_counter() - start)
+                    split_count = len(split_files)
+                finally:
+                    shutil.rmtree(output_dir, ignore_errors=True)
+            best = min(timings)
+            results[mode] = {
+                "best_seconds": round(best, 3),
+                "mb_per_second": round(size_mb / best, 2) if best else None,
+                "split_files": split_count,
+            }
+            print(f"{mode:>12}: {best:.3f}s  ({results[mode]['mb_per_second']} MB/s, {split_count} files)")
+    finally:
+        if temp_input:
+            shutil.rmtree(temp_input, ignore_errors=True)
+    return results
+
+
+def encode_rows_with_pandas(chunk, serial_number, existing_keys, prefix, suffix):
+    """The DataFrame/iterrows encoder the POS Data Income loader used before."""
+    import pandas as pd
+
+    df = pd.DataFrame(chunk)
+    if "invoice_pk" not in df.columns:
+        df["invoice_pk"] = None
+    df["name"] = range(serial_number, serial_number + len(df))
+    for field, value in zip(("creation", "modified", "modified_by", "owner", "docstatus"), prefix):
+        df[field] = value
+    df["active_file_income"], df["split_file"] = suffix
+    df["status"] = df["invoice_pk"].apply(lambda x: "DUPLICATE" if x in existing_keys else "NEW")
+    for field in POS_DATA_INCOME_INSERT_FIELDS:
+        if field not in df.columns:
+            df[field] = None
+    values = []
+    for _, row in df.iterrows():
+        values.append(tuple(row[field] for field in POS_DATA_INCOME_INSERT_FIELDS))
+    return values
+
+
+ROW_ENCODERS = {
+    "pandas_iterrows": encode_rows_with_pandas,
+    "tuple_encoder": encode_pos_data_income_values,
+}
+
+
+def benchmark_row_encoding(invoices=20000, rows_per_invoice=5, repeat=3, encoders=None):
+    """Rows per second for turning POS records into INSERT parameter tuples.
+
+    bench --site <site> execute masar_mce_integration.benchmarks.benchmark_row_encoding
+
+    Only the encoding is timed; no rows are written to the database.
+    """
+    rows = make_sample_rows(int(invoices), int(rows_per_invoice))
+    existing_keys = {row["invoice_pk"] for row in rows[::50]}
+    prefix = ("2025-01-01 00:00:00", "2025-01-01 00:00:00", "Administrator", "Administrator", 0)
+    suffix = ("AFI-0001", "SPLIT-0001")
+    results = {}
+    for encoder in (encoders or ROW_ENCODERS):
+        timings = []
+        try:
+            for _ in range(int(repeat)):
+                start = time.perf_counter()
+                for i in range(0, len(rows), POS_INSERT_CHUNK_SIZE):
+                    ROW_ENCODERS[encoder](rows[i:i + POS_INSERT_CHUNK_SIZE], i + 1, existing_keys, prefix, suffix)
+                timings.append(time.perf_counter() - start)
+        except ImportError as e:
+            print(f"{encoder:>16}: skipped ({e})")
+            continue
+        best = min(timings)
+        results[encoder] = {
+            "best_seconds": round(best, 3),
+            "rows_per_second": int(len(rows) / best) if best else None,
+        }
+        print(f"{encoder:>16}: {best:.3f}s  ({results[encoder]['rows_per_second']} rows/s)")
+    return results
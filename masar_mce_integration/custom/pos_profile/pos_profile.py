@@ -0,0 +1,12 @@
+from masar_mce_integration.masar_mce_integration.doctype.pos_profile_map.pos_profile_map import clear_pos_profile_map
+
+def on_update (self , method) : 
+    clear_pos_profile_map()
+
+
+def after_rename (self , method , old , new , merge=False) : 
+    clear_pos_profile_map()
+
+
+def on_trash (self , method) : 
+    clear_pos_profile_map()
\ No newline at end of file
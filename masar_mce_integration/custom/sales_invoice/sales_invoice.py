@@ -1,10 +1,21 @@
 import frappe 
+from masar_mce_integration.masar_mce_integration.doctype.pos_invoice_registry.pos_invoice_registry import (
+    register_invoice, unregister_sales_invoice
+)
 
 def on_submit (self , method) : 
     update_pos_data_import_status(self)
+    register_invoice(self.get("custom_invoice_pk"), self.name, self.get("custom_pos_data_import"))
+
+
+def on_cancel (self , method) : 
+    update_pos_data_import_status(self)
+    unregister_sales_invoice(self.name)
     
     
 def update_pos_data_import_status(self): 
+    if not self.get("custom_pos_data_import"):
+        return
     frappe.db.set_value(
         'POS Data Import', 
         self.custom_pos_data_import, 
@@ -83,7 +83,13 @@ app_license = "mit"
 # ------------
 
 # before_install = "masar_mce_integration.install.before_install"
-# after_install = "masar_mce_integration.install.after_install"
+after_install = "masar_mce_integration.patches.create_mce_name_counter.execute"
+
+after_migrate = [
+	"masar_mce_integration.patches.create_mce_name_counter.execute",
+	# Adds the Sales Invoice receipt index once the fixtures' custom fields exist.
+	"masar_mce_integration.patches.add_sales_invoice_receipt_index.execute",
+]
 
 # Uninstallation
 # ------------
@@ -141,7 +147,18 @@ doc_events = {
 	"Sales Invoice": {
 		# "on_update": "method",
 		"on_submit": "masar_mce_integration.custom.sales_invoice.sales_invoice.on_submit",
+		"on_cancel": "masar_mce_integration.custom.sales_invoice.sales_invoice.on_cancel",
 		# "on_trash": "method"
+	},
+	"POS Profile": {
+		"on_update": "masar_mce_integration.custom.pos_profile.pos_profile.on_update",
+		"after_rename": "masar_mce_integration.custom.pos_profile.pos_profile.after_rename",
+		"on_trash": "masar_mce_integration.custom.pos_profile.pos_profile.on_trash"
+	},
+	("Item", "Item Barcode"): {
+		"on_update": "masar_mce_integration.master_data.invalidate_barcode_map",
+		"after_rename": "masar_mce_integration.master_data.invalidate_barcode_map",
+		"on_trash": "masar_mce_integration.master_data.invalidate_barcode_map"
 	}
 }
 
@@ -167,6 +184,12 @@ doc_events = {
 # # 	],
 # }
 
+scheduler_events = {
+	"daily": [
+		"masar_mce_integration.utils.create_consolidated_sales_invoices"
+	],
+}
+
 # Testing
 # -------
 
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, KCSC and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("POS Consolidation Link", {
+// 	refresh(frm) {
+
+// 	},
+// });
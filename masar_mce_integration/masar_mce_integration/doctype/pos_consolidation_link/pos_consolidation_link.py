@@ -0,0 +1,57 @@
+# Copyright (c) 2026, KCSC and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now
+
+
+class POSConsolidationLink(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("POS Consolidation Link", ["market_id", "pos_no", "receipt_no"])
+
+
+def link_consolidated_receipts(sales_invoice, pos_data_imports):
+	"""Record that the receipts `pos_data_imports` were posted in `sales_invoice`."""
+	now_str = now()
+	frappe.db.sql(
+		"""
+		INSERT INTO `tabPOS Consolidation Link`
+			(name, creation, modified, modified_by, owner, docstatus, idx,
+			pos_data_import, sales_invoice, invoice_pk, market_id, pos_no, receipt_no)
+		SELECT name, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+			name, %(sales_invoice)s, invoice_pk, market_id, pos_no, receipt_no
+		FROM `tabPOS Data Import`
+		WHERE name IN %(pos_data_imports)s
+		ON DUPLICATE KEY UPDATE
+			sales_invoice = VALUES(sales_invoice),
+			modified = VALUES(modified),
+			modified_by = VALUES(modified_by)
+		""",
+		{
+			"sales_invoice": sales_invoice,
+			"pos_data_imports": tuple(pos_data_imports),
+			"now": now_str,
+			"user": frappe.session.user,
+		},
+	)
+
+
+def get_consolidated_receipt(market_id, pos_no, receipt_no):
+	"""Return {sales_invoice, pos_data_import} of a receipt posted in a submitted consolidated invoice."""
+	rows = frappe.db.sql(
+		"""
+		SELECT link.sales_invoice, link.pos_data_import
+		FROM `tabPOS Consolidation Link` link
+		INNER JOIN `tabSales Invoice` si ON si.name = link.sales_invoice AND si.docstatus = 1
+		WHERE link.market_id = %s AND link.pos_no = %s AND link.receipt_no = %s
+		ORDER BY link.modified DESC
+		LIMIT 1
+		""",
+		(market_id, pos_no, receipt_no),
+		as_dict=True,
+	)
+	return rows[0] if rows else None
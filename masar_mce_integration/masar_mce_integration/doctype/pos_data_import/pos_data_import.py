@@ -5,10 +5,20 @@ import frappe
 from frappe.model.document import Document
 from frappe.utils import flt, now
 from frappe import _
+from masar_mce_integration.masar_mce_integration.doctype.pos_invoice_registry.pos_invoice_registry import (
+    get_registered_invoice
+)
+from masar_mce_integration.masar_mce_integration.doctype.pos_consolidation_link.pos_consolidation_link import (
+    get_consolidated_receipt
+)
+from masar_mce_integration.master_data import MasterDataSnapshot, get_item_code_for_barcode
 
 class POSDataImport(Document):
 
     def validate(self):
+        # Already checked by validate_pos_data_imports for the whole batch.
+        if self.flags.prevalidated:
+            return
         self.check_existing_master_data()
         self.check_available_quantity()
 
@@ -34,63 +44,17 @@ class POSDataImport(Document):
         else:  
             self.create_sales_invoice()
 
+    def get_master_data(self):
+        if not self.flags.master_data_snapshot:
+            self.flags.master_data_snapshot = MasterDataSnapshot()
+        return self.flags.master_data_snapshot
+
     def is_return_receipt(self, receipt_type):
         """Check if the receipt type indicates a return"""
-        if not receipt_type:
-            return False       
-        return_receipt_indicators = [
-            "2", 
-            "مرتجع", 
-            "return",  
-            "refund"   
-        ]
-        receipt_type_str = str(receipt_type).strip().lower()
-        return any(indicator.lower() in receipt_type_str for indicator in return_receipt_indicators)
+        return is_return_receipt(receipt_type)
 
     def check_existing_master_data(self):
-        errors = []
-        total_qty = flt(0)
-        total_amount = flt(0)
-
-        if not self.pos_profile or not frappe.db.exists("POS Profile", self.pos_profile):
-            errors.append(_("POS Profile {0} does not exist.").format(self.pos_profile or _("(empty)")))
-
-        if self.payment_method and not frappe.db.exists("Mode of Payment", self.payment_method):
-            errors.append(_("Mode of Payment {0} does not exist.").format(self.payment_method))
-
-        for row in (self.items or []):
-            qty = flt(row.quantity)
-            amt = flt(row.amount)
-            total_qty += qty
-            total_amount += amt
-            barcode = getattr(row, "barcode", None)
-            if not barcode:
-                errors.append(_("Row {0}: Missing barcode").format(row.idx))
-                continue
-            exists = frappe.db.exists("Item Barcode", {"barcode": barcode})
-            if not exists:
-                errors.append(_("Row {0}: Barcode {1} not found in Item").format(row.idx, barcode))
-                continue
-            item_code = frappe.db.get_value("Item Barcode", {"barcode": barcode}, "parent")
-            row.item_code = item_code    
-
-        parent_total_qty = flt(self.total_quantity)
-        parent_total_amount = flt(
-            self.total if self.total is not None
-            else self.net_value if self.net_value is not None
-            else self.invoice_total if hasattr(self, "invoice_total")
-            else 0
-        )
-
-        if parent_total_qty != total_qty:
-            errors.append(
-                _("Total Quantity mismatch: Expected {0}, Found {1}.").format(parent_total_qty, total_qty)
-            )
-
-        if abs(parent_total_amount - total_amount) > 0.01:
-            errors.append(
-                _("Total Amount mismatch: Expected {0}, Found {1}.").format(parent_total_amount, total_amount)
-            )
+        errors = get_master_data_errors(self, self.items or [], self.get_master_data())
 
         if errors:
             self.status = "Rejected"
@@ -111,47 +75,27 @@ class POSDataImport(Document):
                 frappe.msgprint(self.rejected_reason)
 
     def check_available_quantity(self):
-        if self.is_return_receipt(getattr(self, 'receipt_type', '')):
+        if self.is_return_receipt(getattr(self, 'receipt_type', '')) or self.flags.skip_stock_check:
             return
 
-        not_available = []
         warehouse = None
 
         if self.pos_profile:
-            warehouse = frappe.get_value("POS Profile", self.pos_profile, "warehouse")
+            warehouse = self.get_master_data().get_warehouse(self.pos_profile)
 
         if not warehouse:
             self.db_set("status", self.status or "")
             return
 
-        for row in (self.items or []):
-            item_code = frappe.db.get_value("Item Barcode", {"barcode": row.barcode}, "parent")
-            row.item_code = item_code
-            if not item_code:
-                not_available.append(_("Row {0}: missing item_code").format(row.idx))
-                continue
-
-            actual_qty = flt(frappe.get_value("Bin", {"item_code": item_code, "warehouse": warehouse}, "actual_qty") or 0)
-            reserved_qty = flt(frappe.get_value("Bin", {"item_code": item_code, "warehouse": warehouse}, "reserved_qty") or 0)
-            available = flt(actual_qty) - flt(reserved_qty)
-            required = flt(row.quantity)
-
-            if required > available:
-                not_available.append(
-                    _("Row {0}: Item {1} has insufficient quantity. Available: {2}, Required: {3}.")
-                    .format(row.idx, item_code, available, required)
-                )
-
-        if not_available:
-            self.status = "Rejected"
-            self.rejected_reason = ", ".join(not_available)
-        else:
-            if self.status != "Master Data Checked":
-                if not getattr(self, "rejected_reason", None):
-                    self.status = "Master Data Checked"
-                    self.rejected_reason = ""
-            else:
-                self.rejected_reason = ""
+        items = self.items or []
+        stock = self.flags.stock_projection or StockProjection()
+        item_codes = {get_item_code_for_barcode(row.barcode) for row in items} - {None}
+        not_available = get_stock_errors(items, stock.load(warehouse, item_codes))
+        self.status, self.rejected_reason = apply_stock_errors(
+            self.status, getattr(self, "rejected_reason", None), not_available
+        )
+        if self.status == "Master Data Checked":
+            stock.consume(warehouse, items)
 
         self.db_set("status", self.status)
         self.db_set("rejected_reason", self.rejected_reason)
@@ -166,36 +110,28 @@ class POSDataImport(Document):
         inv_pk = getattr(self, "invoice_pk", None)
         if not inv_pk:
             return
-        others = frappe.get_all(
-            "POS Data Import",
-            filters=[
-                ["invoice_pk", "=", inv_pk],
-                ["name", "!=", self.name or ""]
-            ],
-            fields=["name", "docstatus", "status"],
-            limit_page_length=50
-        )
-
-        if not others:
+        registered = get_registered_invoice(inv_pk)
+        if registered and registered.pos_data_import != self.name:
+            self.db_set("status", "DUPLICATE")
+            self.db_set("rejected_reason", _("DUPLICATE Invoice from {0}").format(
+                registered.pos_data_import or registered.sales_invoice
+            ))
             return
-        for e in others:
-            if e.get("docstatus") == 1 and (e.get("status") or "").upper() == "SUCCESSFUL":
-                self.db_set("status", "DUPLICATE")
-                self.db_set("rejected_reason", _("DUPLICATE Invoice from {0}").format(e.get("name")))
-                return
-
-            if e.get("docstatus") == 0:
-                try:
-                    previous = frappe.get_doc("POS Data Import", e.get("name"))
-                    previous.db_set("status", "DUPLICATE")
-                    previous.db_set("rejected_reason",
-                        _("New Import {0} has been submitted for this Invoice").format(self.name)
-                    )
-                except Exception:
-                    frappe.db.commit()
-                    frappe.throw(
-                        f"Failed to mark previous POS Data Import {e.get('name')} as DUPLICATE"
-                    )
+        try:
+            frappe.db.sql("""
+                UPDATE `tabPOS Data Import`
+                SET status = 'DUPLICATE', rejected_reason = %s
+                WHERE invoice_pk = %s AND name != %s AND docstatus = 0
+            """, (
+                _("New Import {0} has been submitted for this Invoice").format(self.name),
+                inv_pk,
+                self.name or ""
+            ))
+        except Exception:
+            frappe.db.commit()
+            frappe.throw(
+                f"Failed to mark previous POS Data Import for invoice {inv_pk} as DUPLICATE"
+            )
     def process_pos_return(self):
         try:
             original_invoice = self.find_original_invoice()
@@ -226,25 +162,23 @@ class POSDataImport(Document):
             frappe.log_error(f"Missing required fields to find original invoice: market_id={market_id}, refund_receipt_pos_no={refund_receipt_pos_no}, refund_receipt_no={refund_receipt_no}")
             return None
 
-        invoices = frappe.get_all(
-            "Sales Invoice",
-            filters=filters,
-            fields=["name"],
-            limit=1
+        # Set by create_sales_invoice_from_data_import_execute from prefetch_original_invoices.
+        original = self.flags.original_invoice or get_original_invoice(
+            market_id, refund_receipt_pos_no, refund_receipt_no
         )
-
-        if not invoices:
+        if not original:
             frappe.log_error(f"No original invoice found with filters: {filters}")
             return None
+        self.flags.original_pos_data_import = original.pos_data_import
 
         try:
-            return frappe.get_doc("Sales Invoice", invoices[0].name)
+            return frappe.get_doc("Sales Invoice", original.sales_invoice)
         except Exception as e:
-            frappe.log_error(f"Error loading original invoice {invoices[0].name}: {str(e)}")
+            frappe.log_error(f"Error loading original invoice {original.sales_invoice}: {str(e)}")
             return None
 
     def create_return_invoice(self, original_invoice):
-        warehouse = frappe.get_value("POS Profile", self.pos_profile, "warehouse")
+        warehouse = self.get_master_data().get_warehouse(self.pos_profile)
         return_invoice = frappe.new_doc("Sales Invoice")
         return_invoice.is_pos = 1
         return_invoice.is_return = 1
@@ -307,6 +241,9 @@ class POSDataImport(Document):
         return_invoice.custom_pos_data_import = self.name
 
     def copy_items_for_return(self, return_invoice, original_invoice):
+        if self.flags.original_pos_data_import:
+            self.copy_consolidated_items_for_return(return_invoice, original_invoice)
+            return
         for original_item in original_invoice.items:
             return_item = return_invoice.append("items", {})
             return_item.item_code = original_item.item_code
@@ -324,6 +261,36 @@ class POSDataImport(Document):
             return_item.expense_account = original_item.expense_account
             self.set_custom_fields_for_return_item(return_item, original_item)
 
+    def copy_consolidated_items_for_return(self, return_invoice, original_invoice):
+        """Return only the lines of the original receipt from the consolidated invoice it was posted in."""
+        original_items = {}
+        for original_item in original_invoice.items:
+            original_items.setdefault(original_item.item_code, original_item)
+        receipt_items = frappe.get_all(
+            "POS Data Import Item",
+            filters={"parent": self.flags.original_pos_data_import},
+            fields=["barcode", "item_code", "quantity", "amount"],
+            order_by="idx",
+        )
+        for row in receipt_items:
+            original_item = original_items.get(row.item_code or get_item_code_for_barcode(row.barcode))
+            if not original_item:
+                continue
+            qty = flt(row.quantity)
+            return_item = return_invoice.append("items", {})
+            return_item.item_code = original_item.item_code
+            return_item.item_name = original_item.item_name
+            return_item.description = original_item.description
+            return_item.uom = original_item.uom
+            return_item.conversion_factor = original_item.conversion_factor
+            return_item.qty = -abs(qty)
+            return_item.rate = flt(flt(row.amount) / qty) if qty else flt(original_item.rate)
+            return_item.price_list_rate = return_item.rate
+            return_item.income_account = original_item.income_account
+            return_item.cost_center = original_item.cost_center
+            return_item.expense_account = original_item.expense_account
+            self.set_custom_fields_for_return_item(return_item, original_item)
+
     def set_custom_fields_for_return_item(self, return_item, original_item):
         item_custom_fields_mapping = {
             "custom_active_file_income": "custom_active_file_income",
@@ -356,12 +323,7 @@ class POSDataImport(Document):
         self.rejected_reason = ""
         self.db_set("status", self.status)
         self.db_set("rejected_reason", self.rejected_reason)
-        for row in (self.items or []):
-            if getattr(row, "pos_data_ckeck", None):
-                try:
-                    frappe.db.set_value("POS Data Check", row.pos_data_ckeck, "status", "SUCCESSFUL")
-                except Exception:
-                    frappe.log_error(f"Failed to set POS Data Check {row.pos_data_ckeck} to SUCCESSFUL")
+        set_pos_data_checks_successful((self.name,))
 
         frappe.msgprint(_("Return invoice {0} created successfully").format(return_invoice.name))
 
@@ -388,7 +350,8 @@ class POSDataImport(Document):
             self.db_set("rejected_reason", msg)
             frappe.db.commit()
             frappe.throw(msg)
-        warehouse = frappe.get_value("POS Profile", self.pos_profile, "warehouse")
+        master_data = self.get_master_data()
+        warehouse = master_data.get_warehouse(self.pos_profile)
         si = frappe.new_doc("Sales Invoice")
         si.is_pos = 1
         si.pos_profile = self.pos_profile
@@ -399,7 +362,7 @@ class POSDataImport(Document):
         if getattr(self, "posting_time", None):
             si.posting_time = self.posting_time
         si.custom_pos_data_import = self.name
-        si.customer = frappe.db.get_value("POS Profile", self.pos_profile, "customer")
+        si.customer = master_data.get_customer(self.pos_profile)
         si.update_stock = 1
         if warehouse:
             si.set_warehouse = warehouse
@@ -440,12 +403,7 @@ class POSDataImport(Document):
             self.rejected_reason = ""
             self.db_set("status", self.status)
             self.db_set("rejected_reason", self.rejected_reason)
-            for row in (self.items or []):
-                if getattr(row, "pos_data_ckeck", None):
-                    try:
-                        frappe.db.set_value("POS Data Check", row.pos_data_ckeck, "status", "SUCCESSFUL")
-                    except Exception:
-                        frappe.log_error(f"Failed to set POS Data Check {row.pos_data_ckeck} to SUCCESSFUL")
+            set_pos_data_checks_successful((self.name,))
         except Exception as e:
             self.status = "Rejected"
             self.rejected_reason = _("Failed to submit Sales Invoice: {0}").format(str(e))
@@ -506,4 +464,291 @@ class POSDataImport(Document):
             if source_value is not None:
                 setattr(sales_invoice_item, target_field, source_value)
         sales_invoice_item.custom_pos_data_import = self.name
-        sales_invoice_item.custom_pos_data_import_item = pos_data_import_item.name
\ No newline at end of file
+        sales_invoice_item.custom_pos_data_import_item = pos_data_import_item.name
+
+
+def on_doctype_update():
+    frappe.db.add_index("POS Data Import", ["market_id", "refund_receipt_pos_no", "refund_receipt_no"])
+
+
+def is_return_receipt(receipt_type):
+    if not receipt_type:
+        return False       
+    return_receipt_indicators = [
+        "2", 
+        "مرتجع", 
+        "return",  
+        "refund"   
+    ]
+    receipt_type_str = str(receipt_type).strip().lower()
+    return any(indicator.lower() in receipt_type_str for indicator in return_receipt_indicators)
+
+
+def set_pos_data_checks_successful(names):
+    """Mark SUCCESSFUL the POS Data Check rows the items of the POS Data Imports `names` were created from."""
+    frappe.db.sql("""
+        UPDATE `tabPOS Data Check` c
+        JOIN `tabPOS Data Import Item` i
+            ON i.row_pk = c.row_pk
+            AND i.invoice_pk = c.invoice_pk
+            AND i.split_file = c.split_file
+        SET c.status = 'SUCCESSFUL'
+        WHERE i.parent IN %s
+    """, (tuple(names),))
+
+
+def get_master_data_errors(doc, items, master_data):
+    """Master data and totals errors of a POS Data Import, sets item_code on the items found."""
+    errors = []
+    total_qty = flt(0)
+    total_amount = flt(0)
+
+    if not doc.pos_profile or not master_data.has_pos_profile(doc.pos_profile):
+        errors.append(_("POS Profile {0} does not exist.").format(doc.pos_profile or _("(empty)")))
+
+    if doc.payment_method and not master_data.has_payment_method(doc.payment_method):
+        errors.append(_("Mode of Payment {0} does not exist.").format(doc.payment_method))
+
+    for row in items:
+        qty = flt(row.quantity)
+        amt = flt(row.amount)
+        total_qty += qty
+        total_amount += amt
+        barcode = getattr(row, "barcode", None)
+        if not barcode:
+            errors.append(_("Row {0}: Missing barcode").format(row.idx))
+            continue
+        item_code = get_item_code_for_barcode(barcode)
+        if not item_code:
+            errors.append(_("Row {0}: Barcode {1} not found in Item").format(row.idx, barcode))
+            continue
+        row.item_code = item_code    
+
+    parent_total_qty = flt(doc.total_quantity)
+    parent_total_amount = flt(
+        doc.total if doc.total is not None
+        else doc.net_value if doc.net_value is not None
+        else doc.invoice_total if hasattr(doc, "invoice_total")
+        else 0
+    )
+
+    if parent_total_qty != total_qty:
+        errors.append(
+            _("Total Quantity mismatch: Expected {0}, Found {1}.").format(parent_total_qty, total_qty)
+        )
+
+    if abs(parent_total_amount - total_amount) > 0.01:
+        errors.append(
+            _("Total Amount mismatch: Expected {0}, Found {1}.").format(parent_total_amount, total_amount)
+        )
+
+    return errors
+
+
+def get_available_quantities(warehouse, item_codes):
+    """Return {item_code: actual_qty - reserved_qty} from the Bins of `warehouse`."""
+    if not item_codes:
+        return {}
+    return dict(frappe.db.sql("""
+        SELECT item_code, actual_qty - reserved_qty
+        FROM `tabBin`
+        WHERE warehouse = %(warehouse)s
+        AND item_code IN %(item_codes)s
+    """, {"warehouse": warehouse, "item_codes": tuple(item_codes)}))
+
+
+class StockProjection:
+    """Available quantity per warehouse and item for a whole run.
+
+    Bins are read once per item and warehouse, then reduced by the quantities of
+    every POS Data Import accepted in the run, so later documents see the stock
+    the earlier ones will consume.
+    """
+
+    def __init__(self):
+        self.available = {}
+
+    def load(self, warehouse, item_codes):
+        """Return {item_code: available qty} for `warehouse`, reading only items not loaded yet."""
+        available = self.available.setdefault(warehouse, {})
+        missing = set(item_codes) - set(available)
+        if missing:
+            loaded = get_available_quantities(warehouse, missing)
+            available.update({item_code: flt(loaded.get(item_code)) for item_code in missing})
+        return available
+
+    def consume(self, warehouse, items):
+        available = self.available.setdefault(warehouse, {})
+        for row in items:
+            if row.item_code:
+                available[row.item_code] = flt(available.get(row.item_code)) - flt(row.quantity)
+
+
+def get_stock_errors(items, available_qty):
+    not_available = []
+    for row in items:
+        item_code = get_item_code_for_barcode(row.barcode)
+        row.item_code = item_code
+        if not item_code:
+            not_available.append(_("Row {0}: missing item_code").format(row.idx))
+            continue
+
+        available = flt(available_qty.get(item_code) or 0)
+        required = flt(row.quantity)
+
+        if required > available:
+            not_available.append(
+                _("Row {0}: Item {1} has insufficient quantity. Available: {2}, Required: {3}.")
+                .format(row.idx, item_code, available, required)
+            )
+    return not_available
+
+
+def apply_stock_errors(status, rejected_reason, not_available):
+    """Return (status, rejected_reason) once the stock check found `not_available`."""
+    if not_available:
+        return "Rejected", ", ".join(not_available)
+    if status != "Master Data Checked":
+        if not rejected_reason:
+            return "Master Data Checked", ""
+        return status, rejected_reason
+    return status, ""
+
+
+def validate_pos_data_imports(names, master_data=None, stock=None, check_stock=True):
+    """Validate many draft POS Data Imports with a few set-based queries.
+
+    Runs the same checks as POSDataImport.validate, sets item_code on the items
+    and writes status and rejected_reason in bulk. Documents are checked in the
+    order of `names` against `stock`, which is reduced by each accepted one;
+    without `check_stock` only master data and totals are checked.
+    Returns {name: status}.
+    """
+    if not names:
+        return {}
+    master_data = master_data or MasterDataSnapshot()
+    stock = stock or StockProjection()
+    params = {"names": tuple(names)}
+
+    docs = {
+        doc.name: doc
+        for doc in frappe.db.sql("""
+            SELECT name, pos_profile, payment_method, receipt_type, total_quantity, total, net_value
+            FROM `tabPOS Data Import`
+            WHERE name IN %(names)s
+            AND docstatus = 0
+        """, params, as_dict=True)
+    }
+    items_by_parent = {}
+    for row in frappe.db.sql("""
+        SELECT parent, idx, barcode, quantity, amount
+        FROM `tabPOS Data Import Item`
+        WHERE parent IN %(names)s
+        ORDER BY parent, idx
+    """, params, as_dict=True):
+        items_by_parent.setdefault(row.parent, []).append(row)
+
+    stock_checks = {}
+    for name in names:
+        doc = docs.get(name)
+        if not doc:
+            continue
+        items = items_by_parent.get(name, [])
+        errors = get_master_data_errors(doc, items, master_data)
+        doc.status = "Rejected" if errors else "Master Data Checked"
+        doc.rejected_reason = ", ".join(errors)
+        warehouse = master_data.get_warehouse(doc.pos_profile) if doc.pos_profile else None
+        if check_stock and warehouse and not is_return_receipt(doc.receipt_type):
+            stock_checks.setdefault(warehouse, []).append((doc, items))
+
+    for warehouse, checks in stock_checks.items():
+        item_codes = {get_item_code_for_barcode(row.barcode) for _doc, items in checks for row in items} - {None}
+        available_qty = stock.load(warehouse, item_codes)
+        for doc, items in checks:
+            doc.status, doc.rejected_reason = apply_stock_errors(
+                doc.status, doc.rejected_reason, get_stock_errors(items, available_qty)
+            )
+            if doc.status == "Master Data Checked":
+                stock.consume(warehouse, items)
+
+    frappe.db.sql("""
+        UPDATE `tabPOS Data Import Item` i
+        JOIN `tabItem Barcode` ib ON ib.barcode = i.barcode
+        SET i.item_code = ib.parent
+        WHERE i.parent IN %(names)s
+    """, params)
+    frappe.db.bulk_update(
+        "POS Data Import",
+        {doc.name: {"status": doc.status, "rejected_reason": doc.rejected_reason} for doc in docs.values()},
+    )
+    return {doc.name: doc.status for doc in docs.values()}
+
+
+def get_original_invoice(market_id, pos_no, receipt_no):
+    """Return {sales_invoice, pos_data_import} of the receipt a return refers to.
+
+    Cancelled invoices and returns are skipped; a submitted invoice is preferred
+    over a draft, then the most recently modified one. pos_data_import is only
+    set when the receipt was posted in a consolidated invoice.
+    """
+    invoices = frappe.get_all(
+        "Sales Invoice",
+        filters={
+            "custom_market_id": market_id,
+            "custom_pos_no": pos_no,
+            "custom_receipt_no": receipt_no,
+            "docstatus": ["!=", 2],
+            "is_return": 0
+        },
+        fields=["name"],
+        order_by="docstatus desc, modified desc",
+        limit=1
+    )
+    if invoices:
+        return frappe._dict(sales_invoice=invoices[0].name, pos_data_import=None)
+    return get_consolidated_receipt(market_id, pos_no, receipt_no)
+
+
+def prefetch_original_invoices(names):
+    """Resolve the original invoices of the return receipts `names` with one query per source.
+
+    Picks the same invoice as get_original_invoice. Returns
+    {name: {sales_invoice, pos_data_import}} for the returns whose original was
+    found; the others are looked up again when processed, in case
+    their original is created earlier in the same run.
+    """
+    if not names:
+        return {}
+    params = (tuple(names),)
+    originals = {}
+    for row in frappe.db.sql("""
+        SELECT pdi.name, si.name AS sales_invoice
+        FROM `tabPOS Data Import` pdi
+        INNER JOIN `tabSales Invoice` si
+            ON si.custom_market_id = pdi.market_id
+            AND si.custom_pos_no = pdi.refund_receipt_pos_no
+            AND si.custom_receipt_no = pdi.refund_receipt_no
+            AND si.docstatus != 2
+            AND si.is_return = 0
+        WHERE pdi.name IN %s
+        ORDER BY pdi.name, si.docstatus DESC, si.modified DESC
+    """, params, as_dict=True):
+        originals.setdefault(row.name, frappe._dict(sales_invoice=row.sales_invoice, pos_data_import=None))
+
+    missing = tuple(name for name in names if name not in originals)
+    if missing:
+        for row in frappe.db.sql("""
+            SELECT pdi.name, link.sales_invoice, link.pos_data_import
+            FROM `tabPOS Data Import` pdi
+            INNER JOIN `tabPOS Consolidation Link` link
+                ON link.market_id = pdi.market_id
+                AND link.pos_no = pdi.refund_receipt_pos_no
+                AND link.receipt_no = pdi.refund_receipt_no
+            INNER JOIN `tabSales Invoice` si ON si.name = link.sales_invoice AND si.docstatus = 1
+            WHERE pdi.name IN %s
+            ORDER BY pdi.name, link.modified DESC
+        """, (missing,), as_dict=True):
+            originals.setdefault(
+                row.name, frappe._dict(sales_invoice=row.sales_invoice, pos_data_import=row.pos_data_import)
+            )
+    return originals
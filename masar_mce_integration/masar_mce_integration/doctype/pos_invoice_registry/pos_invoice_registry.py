@@ -0,0 +1,89 @@
+# Copyright (c) 2026, KCSC and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now
+
+
+class POSInvoiceRegistry(Document):
+	pass
+
+
+def register_invoice(invoice_pk, sales_invoice, pos_data_import=None):
+	"""Record that `invoice_pk` has a submitted Sales Invoice."""
+	if not invoice_pk:
+		return
+	now_str = now()
+	frappe.db.sql(
+		"""
+		INSERT INTO `tabPOS Invoice Registry`
+			(name, creation, modified, modified_by, owner, docstatus, idx,
+			invoice_pk, sales_invoice, pos_data_import)
+		VALUES (%(invoice_pk)s, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+			%(invoice_pk)s, %(sales_invoice)s, %(pos_data_import)s)
+		ON DUPLICATE KEY UPDATE
+			sales_invoice = VALUES(sales_invoice),
+			pos_data_import = VALUES(pos_data_import),
+			modified = VALUES(modified),
+			modified_by = VALUES(modified_by)
+		""",
+		{
+			"invoice_pk": invoice_pk,
+			"sales_invoice": sales_invoice,
+			"pos_data_import": pos_data_import,
+			"now": now_str,
+			"user": frappe.session.user,
+		},
+	)
+
+
+def unregister_sales_invoice(sales_invoice):
+	frappe.db.sql("DELETE FROM `tabPOS Invoice Registry` WHERE sales_invoice = %s", (sales_invoice,))
+
+
+def get_registered_invoice(invoice_pk):
+	if not invoice_pk:
+		return None
+	return frappe.db.get_value(
+		"POS Invoice Registry", invoice_pk, ["sales_invoice", "pos_data_import"], as_dict=True
+	)
+
+
+def mark_registered_duplicates(split_file):
+	"""Flag the NEW rows of a split whose invoice_pk is already registered as DUPLICATE."""
+	frappe.db.sql(
+		"""
+		UPDATE `tabPOS Data Income` pdi
+		INNER JOIN `tabPOS Invoice Registry` reg ON reg.name = pdi.invoice_pk
+		SET pdi.status = 'DUPLICATE'
+		WHERE pdi.split_file = %s AND pdi.status = 'NEW'
+		""",
+		(split_file,),
+	)
+
+
+def register_consolidated_invoice(sales_invoice, pos_data_imports):
+	"""Register the invoice_pk of every POS Data Import posted in the consolidated `sales_invoice`.
+
+	Existing entries are kept; create_consolidated_sales_invoices drops registered receipts beforehand.
+	"""
+	now_str = now()
+	frappe.db.sql(
+		"""
+		INSERT IGNORE INTO `tabPOS Invoice Registry`
+			(name, creation, modified, modified_by, owner, docstatus, idx,
+			invoice_pk, sales_invoice, pos_data_import)
+		SELECT invoice_pk, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+			invoice_pk, %(sales_invoice)s, name
+		FROM `tabPOS Data Import`
+		WHERE name IN %(pos_data_imports)s
+		AND IFNULL(invoice_pk, '') != ''
+		""",
+		{
+			"sales_invoice": sales_invoice,
+			"pos_data_imports": tuple(pos_data_imports),
+			"now": now_str,
+			"user": frappe.session.user,
+		},
+	)
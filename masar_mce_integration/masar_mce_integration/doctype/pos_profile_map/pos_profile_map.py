@@ -0,0 +1,63 @@
+# Copyright (c) 2026, KCSC and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now
+
+
+class POSProfileMap(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("POS Profile Map", ["market_description", "pos_no"])
+
+
+def resolve_pos_profile_map(split_file=None):
+	"""Add map entries for the (market_description, pos_no) pairs of POS Data Check not mapped yet.
+
+	The POS Profile is matched by name (contains the market description and ends
+	with -<pos_no>), once per new pair. Pairs without a match are stored too, with
+	no POS Profile, so they are not looked up again until the map is cleared.
+	match_count keeps the number of matches; the master data check rejects the
+	receipts of pairs matching more than one POS Profile.
+	"""
+	extra_where = ""
+	params = {"now": now(), "user": frappe.session.user}
+	if split_file:
+		extra_where = "AND c.split_file = %(split_file)s"
+		params["split_file"] = split_file
+	frappe.db.sql(
+		f"""
+		INSERT IGNORE INTO `tabPOS Profile Map`
+			(name, creation, modified, modified_by, owner, docstatus, idx,
+			market_description, pos_no, pos_profile, match_count)
+		SELECT
+			MD5(CONCAT_WS(CHAR(31), d.market_description, d.pos_no)),
+			%(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+			d.market_description, d.pos_no, MIN(pro.name), COUNT(pro.name)
+		FROM (
+			SELECT DISTINCT c.market_description, c.pos_no
+			FROM `tabPOS Data Check` c
+			WHERE c.imported = 0
+			AND c.market_description IS NOT NULL
+			AND c.pos_no IS NOT NULL
+			{extra_where}
+		) d
+		LEFT JOIN `tabPOS Profile Map` m
+			ON m.market_description = d.market_description AND m.pos_no = d.pos_no
+		LEFT JOIN `tabPOS Profile` pro
+			ON pro.name LIKE CONCAT('%%', d.market_description, '%%')
+			AND pro.name LIKE CONCAT('%%-', d.pos_no)
+		WHERE m.name IS NULL
+		GROUP BY d.market_description, d.pos_no
+		""",
+		params,
+	)
+	frappe.db.commit()
+
+
+def clear_pos_profile_map():
+	"""Drop every entry; they are resolved again on the next master data check."""
+	frappe.db.delete("POS Profile Map")
@@ -0,0 +1,71 @@
+import frappe
+
+BARCODE_MAP_VERSION_KEY = "mce_barcode_map_version"
+
+# site -> (version, {barcode: item_code}), shared by every job run by this worker process.
+_barcode_maps = {}
+
+
+def get_barcode_item_map():
+    """Return {barcode: item_code} for all Item Barcodes, loaded with a single query.
+
+    The map is kept in process and reloaded when the version stored in Redis
+    changes, which invalidate_barcode_map does whenever an Item or Item Barcode
+    is changed.
+    """
+    version = frappe.cache().get_value(BARCODE_MAP_VERSION_KEY)
+    if not version:
+        version = frappe.generate_hash(length=10)
+        frappe.cache().set_value(BARCODE_MAP_VERSION_KEY, version)
+
+    cached = _barcode_maps.get(frappe.local.site)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    barcode_map = {}
+    for barcode, item_code in frappe.db.sql("SELECT barcode, parent FROM `tabItem Barcode`"):
+        barcode_map.setdefault(barcode, item_code)
+    _barcode_maps[frappe.local.site] = (version, barcode_map)
+    return barcode_map
+
+
+def get_item_code_for_barcode(barcode):
+    if not barcode:
+        return None
+    return get_barcode_item_map().get(barcode)
+
+
+def invalidate_barcode_map(doc=None, method=None, *args, **kwargs):
+    """Doc event handler for Item and Item Barcode, makes every process reload the map."""
+    frappe.cache().delete_value(BARCODE_MAP_VERSION_KEY)
+    _barcode_maps.pop(frappe.local.site, None)
+
+
+class MasterDataSnapshot:
+    """POS Profiles and Modes of Payment read once and reused for many POS Data Imports.
+
+    create_sales_invoice_from_data_import_execute builds one per run and sets it
+    on each document as `flags.master_data_snapshot`, so validating and
+    submitting the documents makes no master data queries.
+    """
+
+    def __init__(self):
+        self.pos_profiles = {
+            profile.name: profile
+            for profile in frappe.get_all("POS Profile", fields=["name", "warehouse", "customer"])
+        }
+        self.payment_methods = set(frappe.get_all("Mode of Payment", pluck="name"))
+
+    def has_pos_profile(self, pos_profile):
+        return pos_profile in self.pos_profiles
+
+    def has_payment_method(self, payment_method):
+        return payment_method in self.payment_methods
+
+    def get_warehouse(self, pos_profile):
+        profile = self.pos_profiles.get(pos_profile)
+        return profile.warehouse if profile else None
+
+    def get_customer(self, pos_profile):
+        profile = self.pos_profiles.get(pos_profile)
+        return profile.customer if profile else None
@@ -0,0 +1,10 @@
+import frappe
+
+RECEIPT_COLUMNS = ["custom_market_id", "custom_pos_no", "custom_receipt_no"]
+
+
+def execute():
+    # The columns are custom fields from fixtures, which are synced after patches on a new site.
+    if not all(frappe.db.has_column("Sales Invoice", column) for column in RECEIPT_COLUMNS):
+        return
+    frappe.db.add_index("Sales Invoice", RECEIPT_COLUMNS, "custom_receipt_index")
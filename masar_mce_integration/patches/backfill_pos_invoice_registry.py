@@ -0,0 +1,15 @@
+import frappe
+
+
+def execute():
+    frappe.db.sql("""
+        INSERT IGNORE INTO `tabPOS Invoice Registry`
+            (name, creation, modified, modified_by, owner, docstatus, idx,
+            invoice_pk, sales_invoice, pos_data_import)
+        SELECT
+            si.custom_invoice_pk, NOW(), NOW(), 'Administrator', 'Administrator', 0, 0,
+            si.custom_invoice_pk, si.name, si.custom_pos_data_import
+        FROM `tabSales Invoice` si
+        WHERE si.docstatus = 1
+        AND IFNULL(si.custom_invoice_pk, '') != ''
+    """)
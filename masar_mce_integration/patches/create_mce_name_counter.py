@@ -0,0 +1,14 @@
+import frappe
+from masar_mce_integration.utils import NAME_COUNTER_TABLE
+
+
+def execute():
+    # tabSeries.current is INT, too small for the POS Data Check names (1e17 and up).
+    frappe.db.sql_ddl(f"""
+        CREATE TABLE IF NOT EXISTS `{NAME_COUNTER_TABLE}` (
+            name VARCHAR(140) NOT NULL PRIMARY KEY,
+            current BIGINT UNSIGNED NOT NULL DEFAULT 0
+        ) ENGINE=InnoDB
+    """)
+    frappe.db.sql("DELETE FROM `tabSeries` WHERE name LIKE 'MCE-%%'")
+    frappe.db.commit()
@@ -0,0 +1,97 @@
+import frappe
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from re import compile as re_compile
+
+NUMBER_PATTERN = re_compile(r"-?[0-9]+(\.[0-9]+)?")
+YEAR_PATTERN = re_compile(r"[0-9]{4}")
+ZERO_DATES = ("0000-00-00", "0000-00-00 00:00:00", "0000-00-00 00:00:00.000000")
+# Float fields are DECIMAL(21,9), larger values cannot be stored.
+MAX_NUMERIC_VALUE = Decimal(10) ** 12
+
+
+def parse_number(value):
+    if value is None:
+        return None
+    text = str(value)
+    if not NUMBER_PATTERN.fullmatch(text):
+        return None
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return None
+    return number if abs(number) < MAX_NUMERIC_VALUE else None
+
+
+def parse_datetime(value):
+    text = str(value or "")
+    if not text or text in ZERO_DATES:
+        return None
+    for candidate in (text[:19], text[:10]):
+        try:
+            return datetime.fromisoformat(candidate)
+        except ValueError:
+            pass
+    return None
+
+
+def parse_year(value):
+    text = str(value or "")
+    return text if YEAR_PATTERN.fullmatch(text) else None
+
+
+# A rule reads `field` from the incoming record and passes it to `parse`, which
+# returns the parsed value or None when the value is invalid. Invalid values set
+# `bit` in the row's validity_mask and add `message` to its rejected reason. When
+# `column` is set the parsed value is stored there (the column has to exist on
+# POS Data Income and POS Data Check).
+QualityRule = namedtuple("QualityRule", "bit field parse message column")
+
+QUALITY_RULES = (
+    QualityRule(1, "date_timestamp", parse_datetime, "Invalid Date Timestamp", "date_timestamp_dt"),
+    QualityRule(2, "current_year", parse_year, "Invalid Year Format (should be YYYY)", None),
+    QualityRule(4, "idx", parse_number, "Invalid IDX", "idx_num"),
+    QualityRule(8, "quantity", parse_number, "Invalid Quantity", "quantity_num"),
+    QualityRule(16, "rate", parse_number, "Invalid Rate", "rate_num"),
+    QualityRule(32, "amount", parse_number, "Invalid Amount", "amount_num"),
+    QualityRule(64, "row_discount_value", parse_number, "Invalid Discount Value", "row_discount_value_num"),
+    QualityRule(128, "total_quantity", parse_number, "Invalid Total Quantity", "total_quantity_num"),
+    QualityRule(256, "total", parse_number, "Invalid Total", "total_num"),
+    QualityRule(512, "net_value", parse_number, "Invalid Net Value", "net_value_num"),
+    QualityRule(1024, "reminder_value", parse_number, "Invalid Reminder Value", "reminder_value_num"),
+    QualityRule(2048, "pay_value", parse_number, "Invalid Pay Value", "pay_value_num"),
+    QualityRule(4096, "discount_percent", parse_number, "Invalid Discount Percent", "discount_percent_num"),
+    QualityRule(8192, "discount_value", parse_number, "Invalid Invoice Discount Value", "discount_value_num"),
+)
+
+TYPED_COLUMNS = tuple(rule.column for rule in QUALITY_RULES if rule.column)
+# Columns filled by evaluate_quality_rules, in the order it returns them.
+QUALITY_COLUMNS = (*TYPED_COLUMNS, "validity_mask")
+
+
+def evaluate_quality_rules(row, rules=QUALITY_RULES):
+    """Run every rule once against `row`.
+
+    Returns the parsed values of the rules that have a column followed by the
+    validity mask, i.e. in QUALITY_COLUMNS order.
+    """
+    mask = 0
+    values = []
+    for rule in rules:
+        value = rule.parse(row.get(rule.field))
+        if value is None:
+            mask |= rule.bit
+        if rule.column:
+            values.append(value)
+    values.append(mask)
+    return values
+
+
+def get_rejected_reason_sql(alias, rules=QUALITY_RULES):
+    """SQL expression listing the messages of the rules whose bit is set in `alias`.validity_mask."""
+    reasons = ",\n".join(
+        f"IF({alias}.validity_mask & {rule.bit}, {frappe.db.escape(rule.message).replace('%', '%%')}, NULL)"
+        for rule in rules
+    )
+    return f"CONCAT_WS(', ',\n{reasons},\nIF({alias}.status = 'DUPLICATE', 'DUPLICATE Invoice', NULL))"
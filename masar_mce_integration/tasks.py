@@ -1,5 +1,6 @@
-import frappe, os, json , shutil , time , ijson
+import frappe, os, json , shutil , time , ijson , re , tempfile , hashlib
 from collections import  OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 def check_active_paths():
     try:
@@ -11,25 +12,27 @@ def check_active_paths():
             frappe.log_error(f"Active path does not exist: {active_path}", "MCE Integration")
             return
         files = [f for f in os.listdir(active_path) if f.lower().endswith(".json")]
+        prune_file_stability(active_path, files)
         if not files:
             return
         batch_size = int(getattr(settings, "batch_size", 1000) or 1000)
+        stable_seconds = int(getattr(settings, "file_stable_seconds", 0) or FILE_STABLE_SECONDS)
+        ingestion_mode = getattr(settings, "ingestion_mode", None) or INGESTION_SIZE_STABILITY
         print(f"Detected {len(files)} files in active path.")
         for file in files:
             try:
                 file_path = os.path.join(active_path, file)
-                if not is_file_stable(file_path):
-                    continue
-                doc = frappe.get_doc({
-                    "doctype": "Active File Income",
-                    "file_name": file,
-                    "file_path": active_path,
-                    "batch_size": batch_size,
-                    "status": "Reading",
-                    "status_description": "File detected, waiting to be processed"
-                })
-                doc.insert(ignore_permissions=True).submit()
-                frappe.db.commit()
+                done_marker = None
+                if ingestion_mode == INGESTION_DONE_MARKER:
+                    done_marker = get_done_marker(file_path)
+                    if not done_marker:
+                        continue
+                elif ingestion_mode != INGESTION_ATOMIC_RENAME:
+                    if not is_file_ready(file_path, stable_seconds):
+                        continue
+                create_active_file_income(file, active_path, batch_size)
+                frappe.cache().hdel(FILE_STABILITY_CACHE_KEY, file_path)
+                remove_done_marker(done_marker)
             except Exception:
                 frappe.log_error(frappe.get_traceback(), f"MCE File Processing Error: {file}")
                 continue
@@ -37,18 +40,95 @@ def check_active_paths():
         frappe.log_error(frappe.get_traceback(), "MCE Integration Check Error")
 
 
-def is_file_stable(file_path, check_interval=2, max_attempts=3):
-    try:
-        if not os.path.exists(file_path):
-            return False
+def create_active_file_income(file, active_path, batch_size):
+    if frappe.db.exists("Active File Income", {
+        "file_name": file,
+        "file_path": active_path,
+        "status": "Reading",
+        "docstatus": 1
+    }):
+        return None
+    doc = frappe.get_doc({
+        "doctype": "Active File Income",
+        "file_name": file,
+        "file_path": active_path,
+        "batch_size": batch_size,
+        "status": "Reading",
+        "status_description": "File detected, waiting to be processed"
+    })
+    doc.insert(ignore_permissions=True).submit()
+    frappe.db.commit()
+    return doc.name
 
-        sizes = []
-        for _ in range(max_attempts):
-            sizes.append(os.path.getsize(file_path))
-            time.sleep(check_interval)
-        return all(size == sizes[0] for size in sizes)
-    except Exception:
+
+FILE_STABILITY_CACHE_KEY = "mce_file_stability"
+FILE_STABLE_SECONDS = 6
+DONE_MARKER_SUFFIX = ".done"
+INGESTION_SIZE_STABILITY = "Size Stability"
+INGESTION_DONE_MARKER = "Done Marker"
+INGESTION_ATOMIC_RENAME = "Atomic Rename"
+
+
+def is_file_ready(file_path, stable_seconds=FILE_STABLE_SECONDS):
+    """Non-blocking stability check that is tracked across scans.
+
+    The size and mtime seen on each scan are kept in the cache together with the
+    time they were first seen (the mtime itself on first sight). The file is
+    ready once they have not changed for `stable_seconds`.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        frappe.cache().hdel(FILE_STABILITY_CACHE_KEY, file_path)
         return False
+    now_ts = time.time()
+    signature = [stat.st_size, stat.st_mtime_ns]
+    seen = frappe.cache().hget(FILE_STABILITY_CACHE_KEY, file_path)
+    if not seen or seen.get("signature") != signature:
+        seen = {"signature": signature, "since": min(now_ts, stat.st_mtime)}
+        frappe.cache().hset(FILE_STABILITY_CACHE_KEY, file_path, seen)
+    return now_ts - seen["since"] >= stable_seconds
+
+
+def get_done_marker(file_path):
+    """Return the completion marker for `file_path`, or None when it has not been written yet.
+
+    The producer may write either `<name>.json.done` or `<name>.done` once the JSON
+    file is complete.
+    """
+    for marker in (file_path + DONE_MARKER_SUFFIX, os.path.splitext(file_path)[0] + DONE_MARKER_SUFFIX):
+        if os.path.isfile(marker):
+            return marker
+    return None
+
+
+def get_marked_file(marker_path):
+    """Return the JSON file a completion marker refers to, or None."""
+    base = marker_path[:-len(DONE_MARKER_SUFFIX)]
+    for file_path in (base, base + ".json"):
+        if file_path.lower().endswith(".json") and os.path.isfile(file_path):
+            return file_path
+    return None
+
+
+def remove_done_marker(marker_path):
+    if not marker_path:
+        return
+    try:
+        os.remove(marker_path)
+    except FileNotFoundError:
+        pass
+
+
+def prune_file_stability(active_path, files):
+    prefix = os.path.join(active_path, "")
+    current = {os.path.join(active_path, f) for f in files}
+    for file_path in (frappe.cache().hkeys(FILE_STABILITY_CACHE_KEY) or []):
+        if isinstance(file_path, bytes):
+            file_path = file_path.decode()
+        if file_path.startswith(prefix) and file_path not in current:
+            frappe.cache().hdel(FILE_STABILITY_CACHE_KEY, file_path)
+
 
 def process_active_file_income_into_progress(file_income):
     try:
@@ -90,7 +170,11 @@ def process_active_file_income_into_progress(file_income):
             output_dir=progress_dir,
             invoices_per_file=batch_size,
             file_base=file_base_name,
-            doc_name=doc.name
+            doc_name=doc.name,
+            single_pass=bool(getattr(settings, "single_pass_split", 0)),
+            raw_passthrough=bool(getattr(settings, "raw_passthrough_split", 0)),
+            max_open_files=int(getattr(settings, "max_open_split_files", 0) or SPLIT_MAX_OPEN_FILES),
+            processes=int(getattr(settings, "split_processes", 0) or 1)
         )
         print(f"Split files created: {len(split_files)}")
         try:
@@ -98,7 +182,8 @@ def process_active_file_income_into_progress(file_income):
         except Exception:
             pass
         print(f"File moved to progress directory: {temp_file_path}")
-        create_split_file_records(doc.name, split_files, progress_dir)
+        manifest = read_split_manifest(progress_dir, file_base_name)
+        split_file_names = create_split_file_records(doc.name, split_files, progress_dir, manifest=manifest)
         print(f"Created split file records for {doc.name}")
         frappe.db.set_value("Active File Income", doc.name, {
             "status": "Completed",
@@ -107,14 +192,7 @@ def process_active_file_income_into_progress(file_income):
         })
         frappe.db.commit()
         print(f"File {doc.name} split into {len(split_files)} batches.")
-        frappe.enqueue(
-                "masar_mce_integration.tasks.process_split_files",
-                active_file_name=doc.name,
-                queue='long',
-                timeout=3600,
-                is_async=True,
-                job_id=f"process_split_{doc.name}"
-            )
+        enqueue_split_file_processing(split_file_names)
     except Exception:
         error_msg = f"Failed to process file: {frappe.get_traceback()}"
         try:
@@ -129,7 +207,12 @@ def process_active_file_income_into_progress(file_income):
         frappe.log_error(frappe.get_traceback(), "MCE File Processing Error")
 
 
-def split_json_memory_efficient(input_file, output_dir="output", invoices_per_file=2000, file_base=None, doc_name=None):
+SPLIT_MAX_OPEN_FILES = 256
+SPLIT_BUFFER_SIZE = 1024 * 1024
+SPLIT_MAX_BUFFERED = 64 * 1024 * 1024
+
+
+def split_json_memory_efficient(input_file, output_dir="output", invoices_per_file=2000, file_base=None, doc_name=None, single_pass=False, raw_passthrough=False, max_open_files=SPLIT_MAX_OPEN_FILES, processes=1):
 
     start_time = time.time()
     if not file_base:
@@ -139,14 +222,36 @@ def split_json_memory_efficient(input_file, output_dir="output", invoices_per_fi
         os.makedirs(output_dir, exist_ok=True)
 
     frappe.logger().info(f"Starting memory-efficient split: {input_file}")
-    frappe.logger().info(f"Output dir: {output_dir}  invoices_per_file: {invoices_per_file}")
+    frappe.logger().info(f"Output dir: {output_dir}  invoices_per_file: {invoices_per_file}  single_pass: {single_pass}  raw_passthrough: {raw_passthrough}  processes: {processes}")
+    pool = SplitWriterPool(output_dir, file_base, max_open_files=max_open_files)
+    if int(processes or 1) > 1:
+        total_items = split_json_parallel(input_file, pool, invoices_per_file, raw_passthrough, int(processes))
+    elif single_pass:
+        total_items = split_json_single_pass(input_file, pool, invoices_per_file, raw_passthrough)
+    else:
+        total_items = split_json_two_pass(input_file, pool, invoices_per_file, raw_passthrough)
+    writers = pool.writers
+    if not writers:
+        frappe.logger().info("No invoice_pk found; nothing to split.")
+        return []
+
+    pool.close()
+    write_split_manifest(pool, input_file, invoices_per_file, total_items)
+    for i, w in enumerate(writers, start=1):
+        frappe.logger().info(f"Batch {i:04d}: {os.path.basename(w['path'])} -> {w['count']:,} records")
+    total_time = time.time() - start_time
+    frappe.logger().info(f"Splitting finished in {total_time:.2f} seconds (total items scanned: {total_items:,})")
+
+    return [w["path"] for w in writers]
+
+
+def split_json_two_pass(input_file, pool, invoices_per_file, raw_passthrough=False):
     seen = OrderedDict() 
     total_items = 0
     try:
         with open(input_file, "rb") as f:
-            for obj in ijson.items(f, "item"):
+            for pk, _record in iter_split_records(f, raw_passthrough):
                 total_items += 1
-                pk = obj.get("invoice_pk")
                 if pk and pk not in seen:
                     seen[pk] = 0
     except Exception:
@@ -155,74 +260,495 @@ def split_json_memory_efficient(input_file, output_dir="output", invoices_per_fi
     invoice_keys = list(seen.keys())
     total_invoices = len(invoice_keys)
     if total_invoices == 0:
-        frappe.logger().info("No invoice_pk found; nothing to split.")
-        return []
+        return total_items
 
     total_batches = (total_invoices + invoices_per_file - 1) // invoices_per_file
     frappe.logger().info(f"Found {total_invoices} invoices grouped in {total_batches} batches (approx {invoices_per_file} invoices per batch).")
     invoice_to_batch = {}
     for batch_index in range(total_batches):
+        pool.add_writer()
         start = batch_index * invoices_per_file
         end = min((batch_index + 1) * invoices_per_file, total_invoices)
         for pk in invoice_keys[start:end]:
             invoice_to_batch[pk] = batch_index
-    writers = []
-    split_file_paths = []
+            pool.add_invoice(batch_index, pk)
 
     try:
-        for batch_index in range(total_batches):
-            out_name = f"{file_base}_{batch_index+1:04d}.json"
-            out_path = os.path.join(output_dir, out_name)
-            f_handle = open(out_path, "w", encoding="utf-8")
-            f_handle.write("[\n")
-            writers.append({
-                "file": f_handle,
-                "first": True,
-                "count": 0,
-                "path": out_path
-            })
-            split_file_paths.append(out_path)
         with open(input_file, "rb") as f:
-            for obj in ijson.items(f, "item"):
-                pk = obj.get("invoice_pk")
+            for pk, record in iter_split_records(f, raw_passthrough):
                 if not pk:
                     continue
                 batch_index = invoice_to_batch.get(pk)
                 if batch_index is None:
                     continue
+                pool.write(batch_index, encode_split_record(record))
+    except Exception:
+        pool.close(finalize=False)
+        frappe.log_error(frappe.get_traceback(), "Splitter Pass 2 Error")
+        raise
+    return total_items
 
-                writer = writers[batch_index]
-                fh = writer["file"]
 
-                if not writer["first"]:
-                    fh.write(",\n")
-                else:
-                    writer["first"] = False
+def split_json_single_pass(input_file, pool, invoices_per_file, raw_passthrough=False):
+    """Route every record to its batch the first time its invoice_pk is seen.
+
+    Batches are assigned in first-seen invoice order, exactly like the two-pass
+    splitter, so the split files are identical while the input is parsed once.
+    """
+    invoice_to_batch = {}
+    invoices_in_batch = invoices_per_file
+    batch_index = -1
+    total_items = 0
+    try:
+        with open(input_file, "rb") as f:
+            for pk, record in iter_split_records(f, raw_passthrough):
+                total_items += 1
+                if not pk:
+                    continue
+                record_batch = invoice_to_batch.get(pk)
+                if record_batch is None:
+                    if invoices_in_batch >= invoices_per_file:
+                        batch_index = pool.add_writer()
+                        invoices_in_batch = 0
+                    record_batch = invoice_to_batch[pk] = batch_index
+                    pool.add_invoice(batch_index, pk)
+                    invoices_in_batch += 1
+                pool.write(record_batch, encode_split_record(record))
+    except Exception:
+        pool.close(finalize=False)
+        frappe.log_error(frappe.get_traceback(), "Splitter Single Pass Error")
+        raise
+    frappe.logger().info(f"Found {len(invoice_to_batch)} invoices grouped in {len(pool.writers)} batches (approx {invoices_per_file} invoices per batch).")
+    return total_items
+
+
+def get_split_manifest_path(output_dir, file_base):
+    return os.path.join(output_dir, f"{file_base}_manifest.json")
 
-                fh.write(json.dumps(obj, ensure_ascii=False, cls=DecimalEncoder))
 
-                writer["count"] += 1
+def write_split_manifest(pool, input_file, invoices_per_file, total_items):
+    """Write the per-split statistics the splitter already knows next to the splits."""
+    manifest = {
+        "source_file": os.path.basename(input_file),
+        "invoices_per_file": invoices_per_file,
+        "total_records": total_items,
+        "total_invoices": sum(w["invoices"] for w in pool.writers),
+        "created": frappe.utils.now(),
+        "splits": [
+            {
+                "batch_number": i,
+                "file_name": os.path.basename(w["path"]),
+                "record_count": w["count"],
+                "invoice_count": w["invoices"],
+                "byte_size": w["bytes"],
+                "sha256": w["sha256"].hexdigest(),
+                "min_invoice_pk": w["min_invoice_pk"],
+                "max_invoice_pk": w["max_invoice_pk"]
+            }
+            for i, w in enumerate(pool.writers, start=1)
+        ]
+    }
+    manifest_path = get_split_manifest_path(pool.output_dir, pool.file_base)
+    with open(manifest_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1)
+    return manifest_path
+
+
+def read_split_manifest(output_dir, file_base):
+    manifest_path = get_split_manifest_path(output_dir, file_base)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
     except Exception:
-        for w in writers:
-            try:
-                w["file"].close()
-            except Exception:
-                pass
-        frappe.log_error(frappe.get_traceback(), "Splitter Pass 2 Error")
+        frappe.log_error(frappe.get_traceback(), "Split Manifest Read Error")
+        return None
+
+
+RAW_RECORD_BOUNDARY = re.compile(rb'\}\s*,\s*\{')
+
+
+def split_json_parallel(input_file, pool, invoices_per_file, raw_passthrough=False, processes=2):
+    """Split the input by byte ranges in a process pool.
+
+    Every range is first scanned for its invoice_pk order; the orders are merged
+    in range order so batches follow the same first-seen order as the serial
+    splitters. Each range then writes its records into per-batch fragments that
+    are appended to the split files in range order. When a guessed range start
+    turns out not to be a record boundary the file is split in a single pass.
+    """
+    ranges = find_split_ranges(input_file, processes)
+    if len(ranges) < 2:
+        return split_json_single_pass(input_file, pool, invoices_per_file, raw_passthrough)
+    starts = [start for start, _stop in ranges]
+    stops = [stop for _start, stop in ranges]
+    part_dir = tempfile.mkdtemp(prefix=".split_parts_", dir=pool.output_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            scans = list(executor.map(scan_split_range, [input_file] * len(ranges), starts, stops))
+            if not all(aligned for _pks, _items, aligned in scans):
+                frappe.logger().info("Parallel split ranges are not aligned on records; splitting in a single pass.")
+                return split_json_single_pass(input_file, pool, invoices_per_file, raw_passthrough)
+
+            invoice_to_batch = {}
+            invoices_in_batch = invoices_per_file
+            batch_index = -1
+            total_items = 0
+            for pks, items, _aligned in scans:
+                total_items += items
+                for pk in pks:
+                    if pk not in invoice_to_batch:
+                        if invoices_in_batch >= invoices_per_file:
+                            batch_index = pool.add_writer()
+                            invoices_in_batch = 0
+                        invoice_to_batch[pk] = batch_index
+                        pool.add_invoice(batch_index, pk)
+                        invoices_in_batch += 1
+            frappe.logger().info(f"Found {len(invoice_to_batch)} invoices grouped in {len(pool.writers)} batches across {len(ranges)} ranges.")
+
+            max_open_files = max(pool.max_open_files // len(ranges), 1)
+            futures = [
+                executor.submit(
+                    write_split_range, input_file, start, stop,
+                    {pk: invoice_to_batch[pk] for pk in pks},
+                    part_dir, range_index, raw_passthrough, max_open_files
+                )
+                for range_index, ((start, stop), (pks, _items, _aligned)) in enumerate(zip(ranges, scans))
+            ]
+            fragments = [future.result() for future in futures]
+
+        for batch_index in range(len(pool.writers)):
+            for range_fragments in fragments:
+                fragment = range_fragments.get(batch_index)
+                if fragment:
+                    pool.append_fragment(batch_index, fragment[0], fragment[1])
+    except Exception:
+        pool.close(finalize=False)
+        frappe.log_error(frappe.get_traceback(), "Splitter Parallel Error")
+        raise
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    return total_items
+
+
+def find_split_ranges(input_file, parts, window=SPLIT_BUFFER_SIZE):
+    """Cut the file into about `parts` byte ranges that start on a record.
+
+    A range start is only a guess (a `},{` sequence could sit inside a string);
+    scan_split_range confirms it by checking the previous range ends exactly there.
+    """
+    size = os.path.getsize(input_file)
+    starts = []
+    with open(input_file, "rb") as fh:
+        first = fh.read(window).find(b"{")
+        if first == -1:
+            return []
+        starts.append(first)
+        for part in range(1, parts):
+            target = max(size * part // parts, starts[-1] + 1)
+            fh.seek(target)
+            match = RAW_RECORD_BOUNDARY.search(fh.read(window))
+            if match and target + match.end() - 1 > starts[-1]:
+                starts.append(target + match.end() - 1)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def scan_split_range(input_file, start, stop):
+    seen = {}
+    total_items = 0
+    aligned = stop is None
+    try:
+        with open(input_file, "rb") as fh:
+            for offset, raw, nested in iter_raw_json_spans(fh, start=start):
+                if stop is not None and offset >= stop:
+                    aligned = offset == stop
+                    break
+                total_items += 1
+                pk = get_raw_invoice_pk(raw, nested)
+                if pk and pk not in seen:
+                    seen[pk] = None
+    except ValueError:
+        return [], 0, False
+    return list(seen), total_items, aligned
+
+
+def write_split_range(input_file, start, stop, invoice_to_batch, part_dir, range_index,
+        raw_passthrough=False, max_open_files=SPLIT_MAX_OPEN_FILES):
+    pool = SplitWriterPool(part_dir, f"range_{range_index:03d}", max_open_files=max_open_files,
+        suffix=".part", header=b"", footer=b"")
+    for _ in range(max(invoice_to_batch.values(), default=-1) + 1):
+        pool.add_writer()
+    try:
+        with open(input_file, "rb") as fh:
+            for offset, raw, nested in iter_raw_json_spans(fh, start=start):
+                if stop is not None and offset >= stop:
+                    break
+                pk = get_raw_invoice_pk(raw, nested)
+                batch_index = invoice_to_batch.get(pk) if pk else None
+                if batch_index is None:
+                    continue
+                record = raw if raw_passthrough else json.loads(raw, parse_float=Decimal)
+                pool.write(batch_index, encode_split_record(record))
+    except Exception:
+        pool.close(finalize=False)
         raise
+    pool.close()
+    return {index: (w["path"], w["count"]) for index, w in enumerate(pool.writers) if w["count"]}
+
+
+class SplitWriterPool:
+    """Buffered writers for split files with a bounded number of open handles.
+
+    Records are buffered per batch and written in blocks of `buffer_size` bytes.
+    At most `max_open_files` handles stay open; the least recently used one is
+    closed and its file is reopened in append mode on the next flush.
+    """
+
+    def __init__(self, output_dir, file_base, max_open_files=SPLIT_MAX_OPEN_FILES,
+            buffer_size=SPLIT_BUFFER_SIZE, max_buffered=SPLIT_MAX_BUFFERED,
+            suffix=".json", header=b"[\n", footer=b"\n]"):
+        self.output_dir = output_dir
+        self.file_base = file_base
+        self.suffix = suffix
+        self.header = header
+        self.footer = footer
+        self.max_open_files = max(int(max_open_files or SPLIT_MAX_OPEN_FILES), 1)
+        self.buffer_size = buffer_size
+        self.max_buffered = max_buffered
+        self.writers = []
+        self.handles = OrderedDict()
+        self.buffered = 0
+
+    def add_writer(self):
+        batch_index = len(self.writers)
+        out_name = f"{self.file_base}_{batch_index+1:04d}{self.suffix}"
+        self.writers.append({
+            "path": os.path.join(self.output_dir, out_name),
+            "count": 0,
+            "buffer": [self.header] if self.header else [],
+            "buffered": len(self.header),
+            "created": False,
+            "bytes": 0,
+            "sha256": hashlib.sha256(),
+            "invoices": 0,
+            "min_invoice_pk": None,
+            "max_invoice_pk": None
+        })
+        self.buffered += len(self.header)
+        return batch_index
+
+    def add_invoice(self, batch_index, pk):
+        writer = self.writers[batch_index]
+        key = str(pk)
+        writer["invoices"] += 1
+        if writer["min_invoice_pk"] is None or key < writer["min_invoice_pk"]:
+            writer["min_invoice_pk"] = key
+        if writer["max_invoice_pk"] is None or key > writer["max_invoice_pk"]:
+            writer["max_invoice_pk"] = key
 
-    for writer in writers:
+    def write(self, batch_index, payload):
+        writer = self.writers[batch_index]
+        if writer["count"]:
+            writer["buffer"].append(b",\n")
+            writer["buffered"] += 2
+            self.buffered += 2
+        writer["buffer"].append(payload)
+        writer["buffered"] += len(payload)
+        self.buffered += len(payload)
+        writer["count"] += 1
+        if writer["buffered"] >= self.buffer_size:
+            self.flush(batch_index)
+        if self.buffered >= self.max_buffered:
+            self.flush_largest()
+
+    def flush(self, batch_index):
+        writer = self.writers[batch_index]
+        if not writer["buffer"]:
+            return
+        fh = self.get_handle(batch_index)
+        block = b"".join(writer["buffer"])
+        fh.write(block)
+        writer["sha256"].update(block)
+        writer["bytes"] += len(block)
+        self.buffered -= writer["buffered"]
+        writer["buffer"] = []
+        writer["buffered"] = 0
+
+    def append_fragment(self, batch_index, fragment_path, count):
+        """Copy a file of already separated records into the split as-is."""
+        writer = self.writers[batch_index]
+        if writer["count"]:
+            writer["buffer"].append(b",\n")
+            writer["buffered"] += 2
+            self.buffered += 2
+        self.flush(batch_index)
+        fh = self.get_handle(batch_index)
+        with open(fragment_path, "rb") as fragment:
+            for block in iter(lambda: fragment.read(SPLIT_BUFFER_SIZE), b""):
+                fh.write(block)
+                writer["sha256"].update(block)
+                writer["bytes"] += len(block)
+        writer["count"] += count
+
+    def flush_largest(self):
+        pending = sorted(range(len(self.writers)), key=lambda i: self.writers[i]["buffered"], reverse=True)
+        for batch_index in pending:
+            if self.buffered <= self.max_buffered // 2:
+                break
+            self.flush(batch_index)
+
+    def get_handle(self, batch_index):
+        fh = self.handles.get(batch_index)
+        if fh is not None:
+            self.handles.move_to_end(batch_index)
+            return fh
+        while len(self.handles) >= self.max_open_files:
+            _index, oldest = self.handles.popitem(last=False)
+            oldest.close()
+        writer = self.writers[batch_index]
+        fh = open(writer["path"], "ab" if writer["created"] else "wb")
+        writer["created"] = True
+        self.handles[batch_index] = fh
+        return fh
+
+    def close(self, finalize=True):
         try:
-            writer["file"].write("\n]")
-            writer["file"].close()
-        except Exception:
-            pass
-    for i, w in enumerate(writers, start=1):
-        frappe.logger().info(f"Batch {i:04d}: {os.path.basename(w['path'])} -> {w['count']:,} records")
-    total_time = time.time() - start_time
-    frappe.logger().info(f"Splitting finished in {total_time:.2f} seconds (total items scanned: {total_items:,})")
+            if finalize:
+                for batch_index, writer in enumerate(self.writers):
+                    if self.footer:
+                        writer["buffer"].append(self.footer)
+                        writer["buffered"] += len(self.footer)
+                        self.buffered += len(self.footer)
+                    self.flush(batch_index)
+                    fh = self.handles.pop(batch_index, None)
+                    if fh is not None:
+                        fh.close()
+        finally:
+            for fh in self.handles.values():
+                try:
+                    fh.close()
+                except Exception:
+                    pass
+            self.handles.clear()
+
+
+def iter_split_records(fh, raw_passthrough=False):
+    """Yield (invoice_pk, record) for every object of the top-level JSON array.
+
+    With raw_passthrough the record is the original bytes of the object, otherwise
+    it is the dict built by ijson.
+    """
+    if raw_passthrough:
+        yield from iter_raw_json_records(fh)
+        return
+    for obj in ijson.items(fh, "item"):
+        yield obj.get("invoice_pk"), obj
+
+
+def encode_split_record(record):
+    if isinstance(record, bytes):
+        return record
+    return json.dumps(record, ensure_ascii=False, cls=DecimalEncoder).encode("utf-8")
+
+
+RAW_CHUNK_SIZE = 8 * 1024 * 1024
+RAW_SEPARATOR = re.compile(rb'[\s,]*')
+RAW_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|"|[{}]')
+RAW_INVOICE_PK = re.compile(rb'"invoice_pk"\s*:\s*("(?:[^"\\]|\\.)*"|[^\s,}]+)')
+
+
+def iter_raw_json_records(fh, chunk_size=RAW_CHUNK_SIZE):
+    """Find object boundaries in the byte stream without building Python objects.
+
+    For flat objects (the POS rows) the first closing brace ends the record when
+    the bytes before it hold no escape, no nested brace and an even number of
+    quotes; everything else falls back to a brace/string scanner. Only invoice_pk
+    is decoded.
+    """
+    for _offset, raw, nested in iter_raw_json_spans(fh, chunk_size):
+        yield get_raw_invoice_pk(raw, nested), raw
+
+
+def iter_raw_json_spans(fh, chunk_size=RAW_CHUNK_SIZE, start=None):
+    """Yield (offset, raw bytes, nested) for every object of the top-level array.
+
+    Without `start` the stream must begin with the array; with `start` scanning
+    begins at that byte offset, which has to be the first byte of a record.
+    """
+    if start is None:
+        base = 0
+        buf = fh.read(chunk_size)
+        pos = RAW_SEPARATOR.match(buf, 3 if buf.startswith(b"\xef\xbb\xbf") else 0).end()
+        if buf[pos:pos + 1] != b"[":
+            raise ValueError("JSON file must be a list of objects [...]")
+        pos += 1
+    else:
+        fh.seek(start)
+        base = start
+        buf = fh.read(chunk_size)
+        pos = 0
+    eof = False
+    while True:
+        pos = RAW_SEPARATOR.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == 93:  # "]"
+            return
+        end = None
+        nested = False
+        if pos < len(buf):
+            if buf[pos] != 123:  # "{"
+                raise ValueError(f"Expected a JSON object at byte {base + pos}, found {buf[pos:pos + 20]!r}")
+            close = buf.find(b"}", pos)
+            if close != -1:
+                if (
+                    buf.count(b'"', pos, close) % 2 == 0
+                    and buf.find(b"{", pos + 1, close) == -1
+                    and buf.find(b"\\", pos, close) == -1
+                ):
+                    end = close + 1
+                else:
+                    end = find_raw_object_end(buf, pos)
+                    nested = True
+        if end is None:
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            more = fh.read(chunk_size)
+            eof = not more
+            base += pos
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        yield base + pos, buf[pos:end], nested
+        pos = end
+
+
+def find_raw_object_end(buf, start):
+    depth = 0
+    for token in RAW_TOKEN.finditer(buf, start):
+        value = token.group()
+        if value == b"{":
+            depth += 1
+        elif value == b"}":
+            depth -= 1
+            if depth == 0:
+                return token.end()
+        elif value == b'"':
+            return None
+    return None
+
+
+def get_raw_invoice_pk(raw, nested=False):
+    if nested:
+        return json.loads(raw).get("invoice_pk")
+    match = RAW_INVOICE_PK.search(raw)
+    if not match:
+        return None
+    token = match.group(1)
+    if token[:1] == b'"' and b"\\" not in token:
+        return token[1:-1].decode("utf-8")
+    return json.loads(token)
+
 
-    return split_file_paths
 import json
 from decimal import Decimal
 
@@ -281,23 +807,65 @@ def count_json_records(file_path):
                 return len(data) if isinstance(data, list) else 1
         except Exception:
             return 0
-def create_split_file_records(parent_doc, split_files, progress_dir):
+def create_split_file_records(parent_doc, split_files, progress_dir, manifest=None):
+    """Insert all Split File rows of an Active File Income in one bulk insert.
+
+    Names are assigned up front so processing can be enqueued right after the
+    insert. Returns the Split File names in batch order.
+    """
     try:
+        split_stats = {}
+        if manifest:
+            split_stats = {split["file_name"]: split for split in manifest.get("splits", [])}
+        now_str = frappe.utils.now()
+        user = frappe.session.user
+        names = []
+        values = []
         for i, file_path in enumerate(split_files, 1):
             file_name = os.path.basename(file_path)
-            record_count = count_json_records(file_path)
-            split_doc = frappe.get_doc({
-                "doctype": "Split File",
-                "parent_active_file": parent_doc,
-                "file_name": file_name,
-                "file_path": progress_dir,
-                "batch_number": i,
-                "status": "Pending",
-                "total_records": record_count
-            })
-            split_doc.insert(ignore_permissions=True)
+            stats = split_stats.get(file_name)
+            if stats:
+                record_count = stats.get("record_count", 0)
+            else:
+                record_count = count_json_records(file_path)
+                stats = {}
+            name = frappe.generate_hash(length=10)
+            names.append(name)
+            values.append([
+                name,
+                now_str,
+                now_str,
+                user,
+                user,
+                0,
+                i,
+                parent_doc,
+                file_name,
+                progress_dir,
+                i,
+                "Pending",
+                record_count,
+                0,
+                stats.get("invoice_count", 0),
+                stats.get("byte_size", 0),
+                stats.get("sha256"),
+                stats.get("min_invoice_pk"),
+                stats.get("max_invoice_pk")
+            ])
+        if values:
+            frappe.db.bulk_insert(
+                "Split File",
+                [
+                    "name", "creation", "modified", "owner", "modified_by",
+                    "docstatus", "idx", "parent_active_file", "file_name", "file_path",
+                    "batch_number", "status", "total_records", "processed_records",
+                    "invoice_count", "file_size", "checksum", "min_invoice_pk", "max_invoice_pk"
+                ],
+                values
+            )
         frappe.db.commit()
         frappe.logger().info(f"Created {len(split_files)} split file records for {parent_doc}")
+        return names
     except Exception:
         frappe.log_error(frappe.get_traceback(), "Create Split File Records Error")
         raise
@@ -310,20 +878,24 @@ def process_split_files(active_file_name):
                     },
                 fields=["name", "file_name", "file_path", "batch_number"])
         print(f"Found {len(split_files)} split files to process for active file: {active_file_name}")
-        for split_file in split_files:
-            print(f"Enqueuing processing for split file: {split_file.name}")
-            frappe.enqueue(
-                "masar_mce_integration.utils.process_single_split_file",
-                split_file_name=split_file.name,
-                queue='long',
-                timeout=10000,
-                is_async=True,
-                job_id=f"process_split_{split_file.name}"
-            )
+        enqueue_split_file_processing([split_file.name for split_file in split_files])
     except Exception:
         frappe.log_error(frappe.get_traceback(), "Process Split Files Error")
 
 
+def enqueue_split_file_processing(split_file_names):
+    for split_file_name in split_file_names:
+        print(f"Enqueuing processing for split file: {split_file_name}")
+        frappe.enqueue(
+            "masar_mce_integration.utils.process_single_split_file",
+            split_file_name=split_file_name,
+            queue='long',
+            timeout=10000,
+            is_async=True,
+            job_id=f"process_split_{split_file_name}"
+        )
+
+
 
 @frappe.whitelist()
 def process_pending_split_files():
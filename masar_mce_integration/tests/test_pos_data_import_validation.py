@@ -0,0 +1,104 @@
+# Copyright (c) 2026, KCSC and Contributors
+# See license.txt
+
+import frappe
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from frappe.tests.utils import FrappeTestCase
+
+from masar_mce_integration.master_data import MasterDataSnapshot, invalidate_barcode_map
+from masar_mce_integration.masar_mce_integration.doctype.pos_data_import.pos_data_import import (
+	StockProjection,
+	validate_pos_data_imports,
+)
+
+test_dependencies = ["Item"]
+
+WAREHOUSE = "_Test Warehouse - _TC"
+POS_PROFILE = "_Test MCE POS Profile"
+
+
+class TestPOSDataImportValidation(FrappeTestCase):
+	"""validate_pos_data_imports has to reach the same result as POSDataImport.validate."""
+
+	def setUp(self):
+		suffix = frappe.generate_hash(length=8)
+		self.barcode = f"MCE-{suffix}"
+		self.item_code = make_item(
+			f"_Test MCE Item {suffix}", {"is_stock_item": 1, "barcodes": [{"barcode": self.barcode}]}
+		).name
+		make_stock_entry(item_code=self.item_code, target=WAREHOUSE, qty=5, basic_rate=100)
+		invalidate_barcode_map()
+		# Only the POS Profile's warehouse is read, no need for a real POS Profile.
+		self.master_data = MasterDataSnapshot()
+		self.master_data.pos_profiles[POS_PROFILE] = frappe._dict(
+			name=POS_PROFILE, warehouse=WAREHOUSE, customer=None
+		)
+
+	def make_import(self, quantity, receipt_type="1", pos_profile=POS_PROFILE, barcode=None, total=None):
+		doc = frappe.get_doc({
+			"doctype": "POS Data Import",
+			"pos_profile": pos_profile,
+			"receipt_type": receipt_type,
+			"total_quantity": quantity,
+			"total": quantity * 10 if total is None else total,
+			"net_value": quantity * 10,
+			"items": [{
+				"barcode": barcode or self.barcode,
+				"quantity": quantity,
+				"rate": 10,
+				"amount": quantity * 10,
+			}],
+		})
+		doc.flags.prevalidated = True
+		doc.insert()
+		return doc.name
+
+	def validate_in_batch(self, names):
+		statuses = validate_pos_data_imports(names, self.master_data, StockProjection())
+		results = {}
+		for name in names:
+			status, rejected_reason = frappe.db.get_value("POS Data Import", name, ["status", "rejected_reason"])
+			item_codes = frappe.get_all(
+				"POS Data Import Item", filters={"parent": name}, pluck="item_code", order_by="idx"
+			)
+			self.assertEqual(statuses[name], status)
+			results[name] = (status, rejected_reason or "", item_codes)
+		return results
+
+	def validate_one_by_one(self, names):
+		stock = StockProjection()
+		results = {}
+		for name in names:
+			doc = frappe.get_doc("POS Data Import", name)
+			doc.flags.master_data_snapshot = self.master_data
+			doc.flags.stock_projection = stock
+			doc.run_method("validate")
+			results[name] = (doc.status, doc.rejected_reason or "", [row.item_code for row in doc.items])
+		return results
+
+	def assert_paths_match(self, names, expected_statuses):
+		batch = self.validate_in_batch(names)
+		self.assertEqual(self.validate_one_by_one(names), batch)
+		self.assertEqual([batch[name][0] for name in names], expected_statuses)
+
+	def test_accepted_receipt(self):
+		names = [self.make_import(2)]
+		self.assert_paths_match(names, ["Master Data Checked"])
+
+	def test_receipts_competing_for_one_bin(self):
+		# 5 in stock: the first two fit, the third one does not any more.
+		names = [self.make_import(3), self.make_import(2), self.make_import(1)]
+		self.assert_paths_match(names, ["Master Data Checked", "Master Data Checked", "Rejected"])
+
+	def test_master_data_errors(self):
+		names = [
+			self.make_import(1, barcode="MCE-UNKNOWN-BARCODE"),
+			self.make_import(1, pos_profile="_Test MCE Missing Profile"),
+			self.make_import(1, total=999),
+		]
+		self.assert_paths_match(names, ["Rejected", "Rejected", "Rejected"])
+
+	def test_returns_skip_stock_check(self):
+		names = [self.make_import(4), self.make_import(4, receipt_type="2")]
+		self.assert_paths_match(names, ["Master Data Checked", "Master Data Checked"])
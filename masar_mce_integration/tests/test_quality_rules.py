@@ -0,0 +1,69 @@
+# Copyright (c) 2026, KCSC and Contributors
+# See license.txt
+
+from datetime import datetime
+from decimal import Decimal
+
+from frappe.tests.utils import FrappeTestCase
+
+from masar_mce_integration.quality_rules import (
+	QUALITY_COLUMNS,
+	QUALITY_RULES,
+	evaluate_quality_rules,
+	get_rejected_reason_sql,
+	parse_datetime,
+	parse_number,
+	parse_year,
+)
+
+VALID_VALUES = {
+	parse_datetime: ("2026-10-17 10:15:00", datetime(2026, 10, 17, 10, 15)),
+	parse_year: ("2026", "2026"),
+	parse_number: ("-12.50", Decimal("-12.50")),
+}
+INVALID_VALUES = {
+	parse_datetime: (None, "", "0000-00-00 00:00:00", "17/10/2026"),
+	parse_year: (None, "26", "20266", "year"),
+	parse_number: (None, "", "1e5", "12,5", "abc", "1000000000000"),
+}
+
+
+def make_valid_row():
+	return {rule.field: VALID_VALUES[rule.parse][0] for rule in QUALITY_RULES}
+
+
+class TestQualityRules(FrappeTestCase):
+	def test_bits_and_messages_are_unique(self):
+		bits = [rule.bit for rule in QUALITY_RULES]
+		self.assertTrue(all(bit and bit & (bit - 1) == 0 for bit in bits), "every bit is a power of two")
+		self.assertEqual(len(set(bits)), len(bits))
+		self.assertEqual(len({rule.message for rule in QUALITY_RULES}), len(QUALITY_RULES))
+		self.assertEqual(QUALITY_COLUMNS[-1], "validity_mask")
+
+	def test_valid_row(self):
+		values = evaluate_quality_rules(make_valid_row())
+		self.assertEqual(values[-1], 0)
+		expected = [VALID_VALUES[rule.parse][1] for rule in QUALITY_RULES if rule.column]
+		self.assertEqual(values[:-1], expected)
+
+	def test_each_rule(self):
+		columns = [rule.column for rule in QUALITY_RULES if rule.column]
+		for rule in QUALITY_RULES:
+			valid, parsed = VALID_VALUES[rule.parse]
+			self.assertEqual(rule.parse(valid), parsed, rule.field)
+			for invalid in INVALID_VALUES[rule.parse]:
+				with self.subTest(field=rule.field, value=invalid):
+					self.assertIsNone(rule.parse(invalid))
+					row = make_valid_row()
+					row[rule.field] = invalid
+					values = evaluate_quality_rules(row)
+					self.assertEqual(values[-1], rule.bit)
+					if rule.column:
+						self.assertIsNone(values[columns.index(rule.column)])
+
+	def test_rejected_reason_lists_each_message_with_its_bit(self):
+		sql = get_rejected_reason_sql("c")
+		for rule in QUALITY_RULES:
+			self.assertIn(f"IF(c.validity_mask & {rule.bit}, '{rule.message}', NULL)", sql)
+		self.assertIn("Invalid Discount Percent", sql)
+		self.assertIn("Invalid Invoice Discount Value", sql)
@@ -0,0 +1,168 @@
+# Copyright (c) 2026, KCSC and Contributors
+# See license.txt
+
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO
+
+from frappe.tests.utils import FrappeTestCase
+
+from masar_mce_integration.tasks import (
+	SplitWriterPool,
+	find_split_ranges,
+	iter_raw_json_spans,
+	scan_split_range,
+	split_json_parallel,
+	split_json_single_pass,
+	split_json_two_pass,
+)
+
+INVOICES_PER_FILE = 3
+
+
+def make_records(invoices=20, rows_per_invoice=3, tricky=True):
+	"""Rows of interleaved invoices, some carrying strings and nested values the raw scanner must not trip on."""
+	tricky_values = [
+		"},{",
+		'quote " and }, { inside',
+		"back\\slash\\",
+		"\\\"},{\\\"",
+		"مرتجع {عربي}",
+		"",
+	] if tricky else ["plain"]
+	records = []
+	for row in range(rows_per_invoice):
+		for invoice in range(invoices):
+			index = len(records)
+			record = {
+				"invoice_pk": f"INV-{(invoice * 7) % invoices:04d}",
+				"row_pk": f"ROW-{index:05d}",
+				"quantity": "1.10",
+				"amount": index * 1.25,
+				"note": tricky_values[index % len(tricky_values)],
+			}
+			if index % 5 == 0:
+				record["attachments"] = [{"url": "http://x/{a}", "meta": {"size": index}}]
+			if index % 11 == 0:
+				record["invoice_pk"] = f"INV {index % 4}\\ \"quoted\""
+			if index % 13 == 0:
+				del record["invoice_pk"]
+			records.append(record)
+	return records
+
+
+def write_json(path, records, separators=(",", ":")):
+	with open(path, "w", encoding="utf-8") as fh:
+		json.dump(records, fh, ensure_ascii=False, separators=separators)
+
+
+class TestSplitter(FrappeTestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.tmp, ignore_errors=True)
+
+	def split(self, input_file, mode, raw_passthrough, processes=1):
+		output_dir = os.path.join(self.tmp, f"{mode}_{processes}_{int(raw_passthrough)}")
+		os.makedirs(output_dir)
+		pool = SplitWriterPool(output_dir, "out")
+		if mode == "two_pass":
+			total = split_json_two_pass(input_file, pool, INVOICES_PER_FILE, raw_passthrough)
+		elif mode == "single_pass":
+			total = split_json_single_pass(input_file, pool, INVOICES_PER_FILE, raw_passthrough)
+		else:
+			total = split_json_parallel(input_file, pool, INVOICES_PER_FILE, raw_passthrough, processes)
+		pool.close()
+		files = []
+		for writer in pool.writers:
+			with open(writer["path"], "rb") as fh:
+				files.append(fh.read())
+		return total, files
+
+	def assert_modes_match(self, input_file, records):
+		for raw_passthrough in (False, True):
+			expected = self.split(input_file, "two_pass", raw_passthrough)
+			self.assertEqual(expected[0], len(records))
+			self.assertEqual(self.split(input_file, "single_pass", raw_passthrough), expected)
+			for processes in (2, 3, 5):
+				self.assertEqual(
+					self.split(input_file, "parallel", raw_passthrough, processes), expected,
+					f"parallel split with {processes} processes (raw_passthrough={raw_passthrough})",
+				)
+		self.assert_split_contents(expected[1], records)
+
+	def assert_split_contents(self, files, records):
+		"""Every record with an invoice_pk lands once, invoices batched in first-seen order."""
+		invoice_order = []
+		for record in records:
+			pk = record.get("invoice_pk")
+			if pk and pk not in invoice_order:
+				invoice_order.append(pk)
+		split_records = [json.loads(content, parse_float=Decimal) for content in files]
+		self.assertEqual(len(split_records), -(-len(invoice_order) // INVOICES_PER_FILE))
+		for batch_index, batch in enumerate(split_records):
+			batch_invoices = invoice_order[batch_index * INVOICES_PER_FILE:(batch_index + 1) * INVOICES_PER_FILE]
+			expected_rows = [record["row_pk"] for record in records if record.get("invoice_pk") in batch_invoices]
+			self.assertEqual([row["row_pk"] for row in batch], expected_rows)
+
+	def test_modes_produce_identical_splits(self):
+		records = make_records()
+		input_file = os.path.join(self.tmp, "input.json")
+		write_json(input_file, records)
+		self.assert_modes_match(input_file, records)
+
+	def test_modes_match_with_whitespace_between_records(self):
+		records = make_records(invoices=9)
+		input_file = os.path.join(self.tmp, "input.json")
+		write_json(input_file, records, separators=(" ,\n\t", ": "))
+		self.assert_modes_match(input_file, records)
+
+	def test_guessed_boundary_inside_a_string_falls_back(self):
+		# The middle of the file is a long string made of "},{" so the range
+		# aligner guesses a record start that is not one.
+		records = make_records(invoices=4, rows_per_invoice=1)
+		records.insert(2, {"invoice_pk": "INV-LONG", "row_pk": "ROW-LONG", "note": "},{" * 5000})
+		input_file = os.path.join(self.tmp, "input.json")
+		write_json(input_file, records)
+
+		ranges = find_split_ranges(input_file, 2)
+		self.assertEqual(len(ranges), 2)
+		(first_start, first_stop), (second_start, _second_stop) = ranges
+		with open(input_file, "rb") as fh:
+			data = fh.read()
+		long_start = data.index(b'{"invoice_pk":"INV-LONG"')
+		long_stop = data.index(b'{"}', long_start) + 3
+		self.assertTrue(long_start < second_start < long_stop, "the guess should sit inside the string")
+		self.assertFalse(scan_split_range(input_file, first_start, first_stop)[2])
+		self.assert_modes_match(input_file, records)
+
+	def test_aligned_ranges_cover_every_record(self):
+		records = make_records(invoices=30, tricky=False)
+		input_file = os.path.join(self.tmp, "input.json")
+		write_json(input_file, records)
+		ranges = find_split_ranges(input_file, 4)
+		self.assertGreater(len(ranges), 1)
+		scans = [scan_split_range(input_file, start, stop) for start, stop in ranges]
+		self.assertTrue(all(aligned for _pks, _items, aligned in scans))
+		self.assertEqual(sum(items for _pks, items, _aligned in scans), len(records))
+
+	def test_raw_spans_across_chunk_boundaries(self):
+		records = make_records(invoices=5)
+		data = json.dumps(records, ensure_ascii=False).encode("utf-8")
+		for chunk_size in (1, 2, 7, 64, len(data)):
+			spans = list(iter_raw_json_spans(BytesIO(data), chunk_size=chunk_size))
+			self.assertEqual([json.loads(raw) for _offset, raw, _nested in spans], records, f"chunk_size={chunk_size}")
+			for offset, raw, _nested in spans:
+				self.assertEqual(data[offset:offset + len(raw)], raw)
+
+	def test_raw_spans_reject_invalid_input(self):
+		with self.assertRaises(ValueError):
+			list(iter_raw_json_spans(BytesIO(b'{"invoice_pk": "A"}')))
+		with self.assertRaises(ValueError):
+			list(iter_raw_json_spans(BytesIO(b'[{"invoice_pk": "A"}, 1]')))
+		with self.assertRaises(ValueError):
+			list(iter_raw_json_spans(BytesIO(b'[{"invoice_pk": "A", "note": "}')))
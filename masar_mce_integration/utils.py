@@ -1,10 +1,24 @@
 from frappe import db, _
-from frappe.utils import now
+from frappe.utils import flt, now, today
 from json import loads, JSONDecodeError
-import frappe, os, shutil, ijson, json, pandas as pd, time
+import frappe, os, shutil, ijson, json, time, tempfile
 from re import sub
+from itertools import chain
 from typing import Any, Union
 from ast import literal_eval
+from masar_mce_integration.quality_rules import QUALITY_COLUMNS, evaluate_quality_rules, get_rejected_reason_sql
+from masar_mce_integration.masar_mce_integration.doctype.pos_invoice_registry.pos_invoice_registry import (
+    mark_registered_duplicates, register_consolidated_invoice
+)
+from masar_mce_integration.masar_mce_integration.doctype.pos_profile_map.pos_profile_map import resolve_pos_profile_map
+from masar_mce_integration.masar_mce_integration.doctype.pos_data_import.pos_data_import import (
+    StockProjection, get_stock_errors, is_return_receipt, prefetch_original_invoices, set_pos_data_checks_successful,
+    validate_pos_data_imports
+)
+from masar_mce_integration.masar_mce_integration.doctype.pos_consolidation_link.pos_consolidation_link import (
+    link_consolidated_receipts
+)
+from masar_mce_integration.master_data import MasterDataSnapshot, get_item_code_for_barcode
 
 def process_single_split_file(split_file_name):
     try:
@@ -42,46 +56,14 @@ def process_single_split_file(split_file_name):
             frappe.log_error(msg, "Process Split File")
             return
             
-        rows = []
-        total_items = 0
+        rows = iter_split_file_rows(source_path, split_doc.file_name)
         try:
-            with open(source_path, "rb") as fh:
-                for obj in ijson.items(fh, "item"):
-                    total_items += 1
-                    if "attachment_url" not in obj:
-                        if "attachments" in obj and isinstance(obj["attachments"], (list, tuple)) and obj["attachments"]:
-                            first = obj["attachments"][0]
-                            if isinstance(first, dict):
-                                url = first.get("url") or first.get("file_url") or first.get("download_url") or first.get("href")
-                            else:
-                                url = first
-                            obj["attachment_url"] = url
-                        elif "attachments" in obj and isinstance(obj["attachments"], str):
-                            obj["attachment_url"] = obj["attachments"]
-                        else:
-                            obj["attachment_url"] = None
-                    obj["split_file_name"] = split_doc.file_name
-                    rows.append(obj)
-        except Exception as e:
-            msg = f"Error reading split file {source_path}: {str(e)}"
-            frappe.log_error(msg, "Process Split File - Read Error")
-            frappe.db.set_value("Split File", split_doc.name, {
-                "status": "Failed",
-                "status_description": msg,
-                "end_time": now()
-            }, update_modified=False)
-            frappe.db.commit()
-            try:
-                dest = os.path.join(failed_dir, split_doc.file_name)
-                shutil.move(source_path, dest)
-            except Exception:
-                try:
-                    os.remove(source_path)
-                except Exception:
-                    pass
+            first_row = next(rows, None)
+        except SplitFileReadError as e:
+            handle_split_file_read_error(split_doc, source_path, failed_dir, e)
             return
-            
-        if not rows:
+
+        if first_row is None:
             frappe.db.set_value("Split File", split_doc.name, {
                 "status": "Completed",
                 "status_description": "Split file had no rows to process",
@@ -99,14 +81,23 @@ def process_single_split_file(split_file_name):
             
         try:
             insert_result = pos_data_execution_enq(
-                rows=rows,
+                rows=chain((first_row,), rows),
                 split_file=split_doc.name,
                 active_file_income=split_doc.parent_active_file
             )
+            total_items = insert_result["bulk_insert"].get("total_rows", 0)
             status_desc = f"Processed {total_items} rows from split file."
+            expected_rows = int(split_doc.total_records or 0)
+            if expected_rows and expected_rows != total_items:
+                status_desc = f"Processed {total_items} rows from split file (manifest expected {expected_rows})."
+                frappe.log_error(
+                    f"Split file {split_doc.file_name} has {total_items} rows, manifest expected {expected_rows}",
+                    "Process Split File Manifest Mismatch"
+                )
             frappe.db.set_value("Split File", split_doc.name, {
                 "status": "Completed",
                 "status_description": status_desc,
+                "processed_records": total_items,
                 "end_time": now()
             }, update_modified=False)
             frappe.db.commit()
@@ -119,6 +110,10 @@ def process_single_split_file(split_file_name):
                 except Exception:
                     pass
 
+        except SplitFileReadError as e:
+            cleanup_pos_tables_for_split_file(split_doc.name)
+            handle_split_file_read_error(split_doc, source_path, failed_dir, e)
+            return
         except Exception as e:
             msg = f"Failed inserting rows for split file: {str(e)}"
             frappe.log_error(msg, f"Process Split File - Insert Error")
@@ -149,13 +144,71 @@ def process_single_split_file(split_file_name):
         except Exception:
             pass
 
-def pos_data_execution_enq(rows=[], split_file="", active_file_income=""):
+class SplitFileReadError(Exception):
+    pass
+
+
+def iter_split_file_rows(source_path, split_file_name):
+    """Yield the records of a split file one by one, normalized for POS Data Income.
+
+    Errors while reading or parsing the file are raised as SplitFileReadError so
+    callers can tell them apart from insert errors.
+    """
+    try:
+        with open(source_path, "rb") as fh:
+            for obj in ijson.items(fh, "item"):
+                if "attachment_url" not in obj:
+                    if "attachments" in obj and isinstance(obj["attachments"], (list, tuple)) and obj["attachments"]:
+                        first = obj["attachments"][0]
+                        if isinstance(first, dict):
+                            url = first.get("url") or first.get("file_url") or first.get("download_url") or first.get("href")
+                        else:
+                            url = first
+                        obj["attachment_url"] = url
+                    elif "attachments" in obj and isinstance(obj["attachments"], str):
+                        obj["attachment_url"] = obj["attachments"]
+                    else:
+                        obj["attachment_url"] = None
+                obj["split_file_name"] = split_file_name
+                yield obj
+    except Exception as e:
+        raise SplitFileReadError(f"Error reading split file {source_path}: {str(e)}") from e
+
+
+def handle_split_file_read_error(split_doc, source_path, failed_dir, error):
+    msg = str(error)
+    frappe.log_error(msg, "Process Split File - Read Error")
+    frappe.db.set_value("Split File", split_doc.name, {
+        "status": "Failed",
+        "status_description": msg,
+        "end_time": now()
+    }, update_modified=False)
+    frappe.db.commit()
+    try:
+        dest = os.path.join(failed_dir, split_doc.file_name)
+        shutil.move(source_path, dest)
+    except Exception:
+        try:
+            os.remove(source_path)
+        except Exception:
+            pass
+
+
+POS_INSERT_CHUNK_SIZE = 5000
+
+
+def pos_data_execution_enq(rows=(), split_file="", active_file_income=""):
+    """Run the POS pipeline for one split file.
+
+    `rows` may be any iterable (e.g. iter_split_file_rows); it is consumed once
+    and inserted in chunks of POS_INSERT_CHUNK_SIZE.
+    """
     try:
         bulk_insert_result = bulk_insert_from_split_to_pos_data_income(
             rows=rows,
             split_file=split_file,
             active_file_income=active_file_income, 
-            batch_size=50000
+            batch_size=POS_INSERT_CHUNK_SIZE
         )
         quality_check_result = check_quality_incoming_data(split_file)
         master_check_result = master_data_check(split_file)
@@ -172,7 +225,7 @@ def pos_data_execution_enq(rows=[], split_file="", active_file_income=""):
         frappe.log_error(f"POS Data Execution Error: {str(e)}", "POS Data Execution")
         raise
 
-def bulk_insert_from_split_to_pos_data_income(rows, split_file="", active_file_income="", batch_size=50000):
+def bulk_insert_from_split_to_pos_data_income(rows, split_file="", active_file_income="", batch_size=POS_INSERT_CHUNK_SIZE):
     try:
         if split_file:
             frappe.db.sql("""
@@ -182,87 +235,209 @@ def bulk_insert_from_split_to_pos_data_income(rows, split_file="", active_file_i
             frappe.db.commit()
     except Exception as e:
         frappe.log_error(f"Error clearing existing data: {str(e)}", "Bulk Insert Clear Error")
-    if not rows:
-        return {"status": "No data to insert", "count": 0}
+    batch_size = int(batch_size or POS_INSERT_CHUNK_SIZE)
+    use_infile = can_load_data_local_infile()
     now_str = now()
-    df = pd.DataFrame(rows)
-    if "invoice_pk" not in df.columns:
-        df["invoice_pk"] = None
-    primary_keys = tuple(df["invoice_pk"].dropna().unique().tolist())
-    existing_keys = set()
-    if primary_keys:
-        placeholders = ", ".join(["%s"] * len(primary_keys))
-        try:
-            existing_result = frappe.db.sql(
-                f"""
-                SELECT custom_invoice_pk
-                FROM `tabSales Invoice`
-                WHERE custom_invoice_pk IN ({placeholders})
-                AND docstatus = 1
-                """,
-                primary_keys,
-                as_list=True
-            )
-            existing_keys = {x[0] for x in existing_result if x[0]}
-        except Exception as e:
-            frappe.log_error(f"Error checking existing invoices: {str(e)}", "Bulk Insert Check Error")
-    serial_number_result = frappe.db.sql(
-        """SELECT COALESCE(MAX(CAST(name AS UNSIGNED)), 0) FROM `tabPOS Data Income`""",
-        as_list=True,
-    )
-    serial_number = int(serial_number_result[0][0] if serial_number_result else 0) + 1
-    df["name"] = range(serial_number, serial_number + len(df))
-    df["creation"] = now_str
-    df["modified"] = now_str
-    df["owner"] = frappe.session.user
-    df["modified_by"] = frappe.session.user
-    df['active_file_income'] = active_file_income
-    df['split_file'] = split_file
-    df["docstatus"] = 0
-    df["status"] = df["invoice_pk"].apply(lambda x: "DUPLICATE" if x in existing_keys else "NEW")
-    insert_fields = [
-        'name', 'creation', 'modified', 'modified_by', 'owner', 'docstatus', 'status',
-        'idx', 'market_id', 'market_description', 'date_timestamp',
-        'receipt_no', 'pos_no', 'item_code', 'item_description', 'barcode',
-        'quantity', 'discount_percent', 'discount_value', 'total_quantity',
-        'payment_method', 'current_year', 'rate', 'amount', 'offers_id',
-        'refund_receipt_no', 'refund_receipt_pos_no', 'receipt_type',
-        'cashier_no', 'cashier_name', 'total', 'customer_no', 'net_value',
-        'pay_value', 'pay_value_check', 'pay_value_check_no', 'pay_value_visa',
-        'reminder_value', 'client_name', 'national_id', 'program_id',
-        'tid', 'rrn', 'auth', 'customer_type', 'customer_ref',
-        'invoice_pk', 'row_pk', 'row_discount_value',
-        'active_file_income', 'split_file'
-    ]
-    for field in insert_fields:
-        if field not in df.columns:
-            df[field] = None      
-    total_rows = len(df)
+    total_rows = 0
     batch_counter = 0
-    for i in range(0, total_rows, batch_size):
-        batch_df = df.iloc[i:i + batch_size]
-        values = []
-        for _, row in batch_df.iterrows():
-            row_values = tuple(row[field] for field in insert_fields)
-            values.append(row_values)
-        if values:
-            placeholders = "(" + ",".join(["%s"] * len(insert_fields)) + ")"
-            sql_values = [item for sublist in values for item in sublist] 
+    for chunk in iter_chunks(rows, batch_size):
+        serial_number = allocate_name_block("POS Data Income", len(chunk))
+        i = total_rows
+        total_rows += len(chunk)
+        values = encode_pos_data_income_values(
+            chunk, serial_number, (),
+            (now_str, now_str, frappe.session.user, frappe.session.user, 0),
+            (active_file_income, split_file)
+        )
+        if use_infile:
             try:
-                frappe.db.sql(f"""
-                    INSERT INTO `tabPOS Data Income`
-                    ({", ".join(insert_fields)})
-                    VALUES {", ".join([placeholders] * len(values))}
-                """, sql_values)
+                load_pos_data_income_values(values)
                 frappe.db.commit()
-                batch_counter += len(batch_df)
+                batch_counter += len(values)
+                continue
             except Exception as e:
-                frappe.log_error(f"POS Data Execution Error in batch {i}: {str(e)}", "POS Bulk Insert Error")           
+                frappe.db.rollback()
+                use_infile = False
+                frappe.log_error(
+                    f"LOAD DATA LOCAL INFILE failed in batch {i}, falling back to INSERT: {str(e)}",
+                    "POS Bulk Load Error"
+                )
+        try:
+            insert_pos_data_income_values(values)
+            frappe.db.commit()
+            batch_counter += len(values)
+        except Exception as e:
+            frappe.log_error(f"POS Data Execution Error in batch {i}: {str(e)}", "POS Bulk Insert Error")           
+    if not total_rows:
+        frappe.db.commit()
+        return {"status": "No data to insert", "count": 0, "total_rows": 0}
+    try:
+        mark_registered_duplicates(split_file)
+    except Exception as e:
+        frappe.log_error(f"Error checking existing invoices: {str(e)}", "Bulk Insert Check Error")
     frappe.db.commit()
     return {
         "status": "Bulk Insert Completed",
-        "total_inserted": batch_counter
+        "total_rows": total_rows,
+        "total_inserted": batch_counter,
+        "loader": "LOAD DATA LOCAL INFILE" if use_infile else "INSERT"
     }
+
+
+POS_DATA_INCOME_INSERT_FIELDS = [
+    'name', 'creation', 'modified', 'modified_by', 'owner', 'docstatus', 'status',
+    'idx', 'market_id', 'market_description', 'date_timestamp',
+    'receipt_no', 'pos_no', 'item_code', 'item_description', 'barcode',
+    'quantity', 'discount_percent', 'discount_value', 'total_quantity',
+    'payment_method', 'current_year', 'rate', 'amount', 'offers_id',
+    'refund_receipt_no', 'refund_receipt_pos_no', 'receipt_type',
+    'cashier_no', 'cashier_name', 'total', 'customer_no', 'net_value',
+    'pay_value', 'pay_value_check', 'pay_value_check_no', 'pay_value_visa',
+    'reminder_value', 'client_name', 'national_id', 'program_id',
+    'tid', 'rrn', 'auth', 'customer_type', 'customer_ref',
+    'invoice_pk', 'row_pk', 'row_discount_value',
+    'active_file_income', 'split_file',
+    *QUALITY_COLUMNS
+]
+
+# Fields taken from the record itself; the others are filled in by the loader.
+POS_DATA_INCOME_RECORD_FIELDS = POS_DATA_INCOME_INSERT_FIELDS[7:-2 - len(QUALITY_COLUMNS)]
+
+
+def encode_pos_data_income_values(chunk, serial_number, existing_keys, prefix, suffix):
+    """Map each record to a tuple in POS_DATA_INCOME_INSERT_FIELDS order.
+
+    `prefix` holds (creation, modified, modified_by, owner, docstatus) and `suffix`
+    holds (active_file_income, split_file); both are the same for every row of a
+    chunk. Missing record fields are inserted as NULL, and rows whose invoice_pk
+    is in `existing_keys` get the DUPLICATE status. The quality rule columns come
+    last (see quality_rules.evaluate_quality_rules).
+    """
+    record_fields = POS_DATA_INCOME_RECORD_FIELDS
+    values = []
+    append = values.append
+    for name, row in enumerate(chunk, serial_number):
+        status = "DUPLICATE" if row.get("invoice_pk") in existing_keys else "NEW"
+        append((name, *prefix, status, *map(row.get, record_fields), *suffix, *evaluate_quality_rules(row)))
+    return values
+
+
+def insert_pos_data_income_values(values):
+    if not values:
+        return
+    placeholders = "(" + ",".join(["%s"] * len(POS_DATA_INCOME_INSERT_FIELDS)) + ")"
+    frappe.db.sql(f"""
+        INSERT INTO `tabPOS Data Income`
+        ({", ".join(POS_DATA_INCOME_INSERT_FIELDS)})
+        VALUES {", ".join([placeholders] * len(values))}
+    """, list(chain.from_iterable(values)))
+
+
+def can_load_data_local_infile():
+    """True when the setting is on and both the client and the server allow LOAD DATA LOCAL INFILE."""
+    if not frappe.db.get_single_value("MCE Integration Setting", "load_data_local_infile"):
+        return False
+    if not frappe.conf.get("local_infile"):
+        frappe.log_error(
+            "Load Data Local Infile is enabled but local_infile is not set in site_config.json, using INSERT",
+            "POS Bulk Load Config"
+        )
+        return False
+    try:
+        server_flag = frappe.db.sql("SELECT @@GLOBAL.local_infile", as_list=True)[0][0]
+    except Exception:
+        return False
+    if not int(server_flag or 0):
+        frappe.log_error(
+            "Load Data Local Infile is enabled but local_infile is off on the database server, using INSERT",
+            "POS Bulk Load Config"
+        )
+        return False
+    return True
+
+
+TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+
+def encode_tsv_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    return str(value).translate(TSV_ESCAPES)
+
+
+def write_pos_data_income_tsv(values, file_path):
+    with open(file_path, "w", encoding="utf-8", newline="\n") as fh:
+        for row in values:
+            fh.write("\t".join(map(encode_tsv_value, row)))
+            fh.write("\n")
+
+
+def load_pos_data_income_values(values):
+    """Load encoded rows through a TSV staging file and LOAD DATA LOCAL INFILE."""
+    if not values:
+        return
+    fd, staging_file = tempfile.mkstemp(prefix="pos_data_income_", suffix=".tsv")
+    os.close(fd)
+    try:
+        write_pos_data_income_tsv(values, staging_file)
+        frappe.db.sql(f"""
+            LOAD DATA LOCAL INFILE %s
+            INTO TABLE `tabPOS Data Income`
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n'
+            ({", ".join(POS_DATA_INCOME_INSERT_FIELDS)})
+        """, (staging_file,))
+    finally:
+        try:
+            os.remove(staging_file)
+        except OSError:
+            pass
+
+
+NAME_COUNTER_TABLE = "__mce_name_counter"
+
+
+def allocate_name_block(doctype, count, floor=0):
+    """Reserve `count` consecutive numeric names for `doctype` and return the first one.
+
+    The counter is a BIGINT UNSIGNED row in NAME_COUNTER_TABLE (created by the
+    create_mce_name_counter patch), seeded once from the current
+    MAX(CAST(name AS UNSIGNED)) of the doctype (at least `floor`). Each call is a
+    single UPDATE on one row, so parallel split jobs get disjoint blocks. The
+    allocation is committed right away to release the row lock.
+    """
+    count = int(count)
+    if not frappe.db.sql(f"SELECT 1 FROM `{NAME_COUNTER_TABLE}` WHERE name = %s", (doctype,)):
+        frappe.db.sql(f"""
+            INSERT IGNORE INTO `{NAME_COUNTER_TABLE}` (name, current)
+            SELECT %s, GREATEST(COALESCE(MAX(CAST(name AS UNSIGNED)), 0), %s)
+            FROM `tab{doctype}`
+        """, (doctype, floor))
+    frappe.db.sql(
+        f"UPDATE `{NAME_COUNTER_TABLE}` SET current = LAST_INSERT_ID(current + %s) WHERE name = %s",
+        (count, doctype)
+    )
+    last = int(frappe.db.sql("SELECT LAST_INSERT_ID()", as_list=True)[0][0])
+    frappe.db.commit()
+    return last - count + 1
+
+
+def iter_chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def check_quality_incoming_data(split_file=None):
     if split_file:
         data_in_buffer = frappe.db.sql(
@@ -279,17 +454,19 @@ def check_quality_incoming_data(split_file=None):
     return data_quality_check_execute(split_file)
 def data_quality_check_execute(split_file=None):
     user_ = frappe.session.user
-    frappe.db.sql("""
-        SET @base := (
-            SELECT IFNULL(MAX(CAST(name AS UNSIGNED)), 100000000000000000)
-            FROM `tabPOS Data Check`
-        );
-    """)
     extra_where = ""
     params = [user_, user_]
     if split_file:
         extra_where = " WHERE tipd.split_file = %s"
         params.extend([split_file])
+    row_count = frappe.db.sql(
+        f"SELECT COUNT(*) FROM `tabPOS Data Income` tipd{extra_where}",
+        tuple(params[2:]), as_list=True
+    )[0][0]
+    if not row_count:
+        return {"status": "No Data in Buffer", "count": 0}
+    base = allocate_name_block("POS Data Check", row_count, floor=100000000000000000)
+    frappe.db.sql("SET @base := %s", (base - 1,))
     query = """
         INSERT INTO `tabPOS Data Check` (
             name,
@@ -344,7 +521,8 @@ def data_quality_check_execute(split_file=None):
             payment_method,
             active_file_income,
             split_file,
-            imported
+            imported,
+            {quality_columns}
         )
         SELECT
             LPAD(@base := @base + 1, 18, '0') AS name,
@@ -354,65 +532,10 @@ def data_quality_check_execute(split_file=None):
             %s AS owner,
             CASE
                 WHEN tipd.status = 'DUPLICATE' THEN 'DUPLICATE'
-                WHEN 
-                    (
-                        NULLIF(tipd.date_timestamp, '') IS NOT NULL
-                        AND tipd.date_timestamp NOT IN (
-                            '0000-00-00', 
-                            '0000-00-00 00:00:00', 
-                            '0000-00-00 00:00:00.000000'
-                        )
-                        AND (
-                            STR_TO_DATE(REPLACE(LEFT(tipd.date_timestamp,19), 'T', ' '), '%%Y-%%m-%%d %%H:%%i:%%s') IS NOT NULL
-                            OR STR_TO_DATE(LEFT(tipd.date_timestamp,10), '%%Y-%%m-%%d') IS NOT NULL
-                        )
-                    )
-                    AND tipd.idx REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.quantity REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.rate REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.amount REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.row_discount_value REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.discount_percent REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.discount_value REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.total_quantity REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.total REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.net_value REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.reminder_value REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.pay_value REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
-                    AND tipd.current_year REGEXP '^[0-9]{{4}}$'
-                THEN 'Quality Checked'
+                WHEN tipd.validity_mask = 0 THEN 'Quality Checked'
                 ELSE 'Rejected'
             END AS status,
-            CONCAT_WS(', ',
-                IF(
-                    (
-                        NULLIF(tipd.date_timestamp, '') IS NULL
-                        OR tipd.date_timestamp IN (
-                            '0000-00-00', 
-                            '0000-00-00 00:00:00', 
-                            '0000-00-00 00:00:00.000000'
-                        )
-                        OR (
-                            STR_TO_DATE(REPLACE(LEFT(tipd.date_timestamp,19), 'T', ' '), '%%Y-%%m-%%d %%H:%%i:%%s') IS NULL
-                            AND STR_TO_DATE(LEFT(tipd.date_timestamp,10), '%%Y-%%m-%%d') IS NULL
-                        )
-                    ),
-                    'Invalid Date Timestamp',
-                    NULL
-                ),
-                IF(tipd.current_year NOT REGEXP '^[0-9]{{4}}$', 'Invalid Year Format (should be YYYY)', NULL),
-                IF(tipd.idx NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid IDX', NULL),
-                IF(tipd.quantity NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Quantity', NULL),
-                IF(tipd.rate NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Rate', NULL),
-                IF(tipd.amount NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Amount', NULL),
-                IF(tipd.row_discount_value NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Discount Value', NULL),
-                IF(tipd.total_quantity NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Total Quantity', NULL),
-                IF(tipd.total NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Total', NULL),
-                IF(tipd.net_value NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Net Value', NULL),
-                IF(tipd.reminder_value NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Reminder Value', NULL),
-                IF(tipd.pay_value NOT REGEXP '^-?[0-9]+(\\.[0-9]+)?$', 'Invalid Pay Value', NULL),
-                IF(tipd.status = 'DUPLICATE' , 'DUPLICATE Invoice' , NULL )
-            ) AS rejected_reason,
+            {rejected_reason} AS rejected_reason,
             tipd.invoice_pk,
             tipd.row_pk,
             tipd.market_id,
@@ -458,11 +581,17 @@ def data_quality_check_execute(split_file=None):
             tipd.payment_method,
             tipd.active_file_income,
             tipd.split_file,
-            0 AS imported
+            0 AS imported,
+            {quality_values}
         FROM `tabPOS Data Income` tipd
         {extra_where}
     """
-    query = query.format(extra_where=extra_where)
+    query = query.format(
+        extra_where=extra_where,
+        rejected_reason=get_rejected_reason_sql("tipd"),
+        quality_columns=", ".join(QUALITY_COLUMNS),
+        quality_values=", ".join(f"tipd.{column}" for column in QUALITY_COLUMNS)
+    )
     frappe.db.sql(query, tuple(params), as_dict=True)
     if split_file:
         frappe.db.sql("""
@@ -508,19 +637,10 @@ def master_data_check(split_file=None):
         return {"status": "No Data in Master Data Check With Quality Checked or Rejected Status", "count": no_of_rows}
     return master_data_check_execute(split_file)
 
-def master_data_check_execute(split_file=None):
-    frappe.clear_cache()
-    frappe.flags.in_import = True
-    frappe.flags.mute_emails = True
-    frappe.flags.in_migrate = True
-
-    extra_where = ""
-    params = []
-
-    if split_file:
-        extra_where = " AND c.split_file = %s "
-        params.append(split_file)
-    query_template = """
+# Invoices of the POS Data Check rows that are not imported yet, one row per
+# market / POS / year / receipt with its master data status. {items_column} is
+# either MASTER_DATA_ITEMS_JSON or a plain NULL AS items.
+MASTER_DATA_CHECK_CTE = """
         WITH items AS (
             SELECT 
                 ib.barcode AS barcode,
@@ -528,7 +648,7 @@ def master_data_check_execute(split_file=None):
             FROM `tabItem Barcode` ib
         ), 
         pos_profiles AS (
-            SELECT name AS pos_profile FROM `tabPOS Profile`
+            SELECT market_description, pos_no, pos_profile, match_count FROM `tabPOS Profile Map`
         ),
         payment_methods AS (
             SELECT name as payment_method FROM `tabMode of Payment`
@@ -542,6 +662,10 @@ def master_data_check_execute(split_file=None):
                 c.rate,
                 c.amount,
                 c.row_discount_value,
+                c.quantity_num,
+                c.amount_num,
+                c.total_num,
+                c.total_quantity_num,
                 c.name as pos_data_check, 
                 c.status as pos_data_check_status, 
                 c.rejected_reason as pos_data_check_rejected_reason, 
@@ -561,8 +685,8 @@ def master_data_check_execute(split_file=None):
                 c.market_description, 
                 c.pos_no,
                 c.receipt_no,
-                DATE(c.date_timestamp) AS posting_date,
-                TIME(c.date_timestamp) AS posting_time,
+                DATE(COALESCE(c.date_timestamp_dt, c.date_timestamp)) AS posting_date,
+                TIME(COALESCE(c.date_timestamp_dt, c.date_timestamp)) AS posting_time,
                 c.current_year, 
                 c.discount_percent,
                 c.discount_value,
@@ -606,7 +730,7 @@ def master_data_check_execute(split_file=None):
                 r.market_description,
                 r.pos_no,
                 r.receipt_no,
-                pro.pos_profile,
+                CASE WHEN pro.match_count > 1 THEN NULL ELSE pro.pos_profile END AS pos_profile,
                 r.posting_date,
                 r.posting_time,
                 r.current_year,
@@ -635,10 +759,10 @@ def master_data_check_execute(split_file=None):
                 r.pay_visa_type,
                 r.reminder_value, 
                 r.receipt_type,
-                SUM(r.quantity) AS sum_of_rows_quantity, 
-                SUM(r.amount) AS sum_of_rows_total, 
-                MAX(r.total) AS total, 
-                MAX(r.total_quantity) AS total_quantity,
+                SUM(r.quantity_num) AS sum_of_rows_quantity, 
+                SUM(r.amount_num) AS sum_of_rows_total, 
+                MAX(r.total_num) AS total, 
+                MAX(r.total_quantity_num) AS total_quantity,
                 r.row_status, 
                 SUM(CASE WHEN r.row_status = 'Rejected' THEN 1 ELSE 0 END) AS rejected_items_count,
                 TRIM(
@@ -653,29 +777,14 @@ def master_data_check_execute(split_file=None):
                     )
                 ) AS rejected_reason,
                 MAX(CASE WHEN pro.pos_profile IS NOT NULL THEN 1 ELSE 0 END) AS profile_exists,
+                MAX(COALESCE(pro.match_count, 0)) AS profile_match_count,
                 MAX(CASE WHEN pm.payment_method IS NOT NULL THEN 1 ELSE 0 END) AS payment_method_exists, 
-                JSON_ARRAYAGG(
-                    JSON_OBJECT(
-                        'item_code', r.item_code,
-                        'barcode', r.barcode,
-                        'item_description', r.item_description,
-                        'quantity', r.quantity,
-                        'rate', r.rate,
-                        'amount', r.amount,
-                        'discount_value', r.row_discount_value,
-                        'status', r.row_status,
-                        'rejected_reason', r.row_rejected_reason,
-                        'invoice_pk', r.invoice_pk,
-                        'row_pk', r.row_pk , 
-                        'active_file_income', r.active_file_income,
-                        'split_file', r.split_file
-                    )
-                ) AS items,
+                {items_column},
                 MAX(r.active_file_income) AS active_file_income,
                 MAX(r.split_file) AS split_file
             FROM pos_data_row AS r 
-            LEFT JOIN pos_profiles AS pro ON pro.pos_profile LIKE CONCAT('%%', r.market_description, '%%')
-                AND pro.pos_profile LIKE CONCAT('%%-', r.pos_no)
+            LEFT JOIN pos_profiles AS pro ON pro.market_description = r.market_description
+                AND pro.pos_no = r.pos_no
             LEFT JOIN payment_methods AS pm ON r.payment_method = pm.payment_method
             GROUP BY r.market_id, r.pos_no, r.current_year, r.receipt_no
         ), 
@@ -726,6 +835,7 @@ def master_data_check_execute(split_file=None):
                         OR ABS(COALESCE(p.total, 0) - COALESCE(p.sum_of_rows_total, 0)) > 0.01 
                         OR COALESCE(p.total_quantity, 0) <> COALESCE(p.sum_of_rows_quantity, 0)
                         OR profile_exists = 0 
+                        OR p.profile_match_count > 1
                         OR payment_method_exists = 0 
                     THEN 'Master Data Rejected'
                     ELSE 'Master Data Checked'
@@ -738,6 +848,10 @@ def master_data_check_execute(split_file=None):
                             CASE WHEN p.row_status = 'Rejected' THEN 'Quality Rejected' ELSE NULL END,
                             CASE WHEN NULLIF(p.rejected_reason, '') IS NOT NULL THEN p.rejected_reason ELSE NULL END,
                             CASE WHEN p.profile_exists = 0 THEN CONCAT('POS profile not found: ', p.pos_profile) ELSE NULL END,
+                            CASE WHEN p.profile_match_count > 1
+                                THEN CONCAT('Ambiguous POS profile: ', p.profile_match_count, ' profiles match ', p.market_description, ' / ', p.pos_no)
+                                ELSE NULL
+                            END,
                             CASE WHEN payment_method_exists = 0 THEN CONCAT('Payment method not found: ', p.payment_method) ELSE NULL END,
                             CASE WHEN ABS(COALESCE(p.total, 0) - COALESCE(p.sum_of_rows_total, 0)) > 0.01 
                                 THEN CONCAT('Invoice amount mismatch: ', ROUND(p.total, 2), ' vs ', ROUND(p.sum_of_rows_total, 2)) 
@@ -752,6 +866,45 @@ def master_data_check_execute(split_file=None):
                 ) AS rejected_reason
             FROM pos_invoice_collecting p
         )
+"""
+
+MASTER_DATA_ITEMS_JSON = """
+                JSON_ARRAYAGG(
+                    JSON_OBJECT(
+                        'item_code', r.item_code,
+                        'barcode', r.barcode,
+                        'item_description', r.item_description,
+                        'quantity', r.quantity,
+                        'rate', r.rate,
+                        'amount', r.amount,
+                        'discount_value', r.row_discount_value,
+                        'status', r.row_status,
+                        'rejected_reason', r.row_rejected_reason,
+                        'invoice_pk', r.invoice_pk,
+                        'row_pk', r.row_pk , 
+                        'active_file_income', r.active_file_income,
+                        'split_file', r.split_file
+                    )
+                ) AS items
+"""
+
+
+def master_data_check_execute(split_file=None):
+    resolve_pos_profile_map(split_file)
+    if frappe.db.get_single_value("MCE Integration Setting", "set_based_master_data"):
+        return master_data_check_execute_set_based(split_file)
+    frappe.clear_cache()
+    frappe.flags.in_import = True
+    frappe.flags.mute_emails = True
+    frappe.flags.in_migrate = True
+
+    extra_where = ""
+    params = []
+
+    if split_file:
+        extra_where = " AND c.split_file = %s "
+        params.append(split_file)
+    query_template = MASTER_DATA_CHECK_CTE + """
         SELECT JSON_OBJECT(
             'invoice_pk', j.invoice_pk,
             'market_id', j.market_id,
@@ -797,7 +950,7 @@ def master_data_check_execute(split_file=None):
         ) as invoice
         FROM pos_invoice j
     """
-    query = query_template.format(extra_where=extra_where)
+    query = query_template.format(extra_where=extra_where, items_column=MASTER_DATA_ITEMS_JSON)
     sql_params = tuple(params) if params else ()
     
     if params:
@@ -810,11 +963,7 @@ def master_data_check_execute(split_file=None):
     batch_size = 5000
     total_processed = 0
     now_str = now()
-    serial_number_result = frappe.db.sql("""
-        SELECT COALESCE(MAX(CAST(name AS UNSIGNED)), 0)
-        FROM `tabPOS Data Import`
-    """, as_list=True) 
-    serial_number = int(serial_number_result[0][0]) + 1 if serial_number_result else 1 
+    serial_number = allocate_name_block("POS Data Import", len(pos_invoice)) if pos_invoice else 1
     for record in pos_invoice:
         raw = record.invoice
         data = safe_json_loads(raw)
@@ -923,6 +1072,114 @@ def master_data_check_execute(split_file=None):
     frappe.flags.in_migrate = False
     return {"status": "Master Data Check Executed", "count": total_processed}
 
+POS_DATA_IMPORT_INVOICE_FIELDS = [
+    "invoice_pk", "status", "rejected_reason", "split_file", "active_file_income",
+    "market_id", "market_description", "pos_no", "pos_profile", "receipt_no", "receipt_type",
+    "posting_date", "posting_time", "current_year", "discount_percent", "discount_value",
+    "payment_method", "total_quantity", "total", "net_value", "client_name",
+    "national_id", "program_id", "tid", "rrn", "auth", "offers_id",
+    "refund_receipt_no", "refund_receipt_pos_no", "cashier_no", "cashier_name",
+    "customer_no", "customer_ref", "customer_type", "pay_value", "pay_value_visa",
+    "reminder_value", "pay_value_check_no", "pay_visa_type", "pay_value_check"
+]
+MASTER_DATA_TEMP_TABLE = "tmp_master_data_invoice"
+MASTER_DATA_RECEIPT_JOIN = """
+    t.market_id <=> c.market_id
+    AND t.pos_no <=> c.pos_no
+    AND t.current_year <=> c.current_year
+    AND t.receipt_no <=> c.receipt_no
+"""
+
+
+def master_data_check_execute_set_based(split_file=None):
+    """Build POS Data Import and its items with INSERT ... SELECT, without fetching rows.
+
+    The invoices of the master data CTE are materialized in a temporary table with
+    an AUTO_INCREMENT seq; each invoice is named from a block reserved with
+    allocate_name_block plus its seq, and items are named <parent>-<row number>.
+    """
+    extra_where = ""
+    params = []
+    if split_file:
+        extra_where = " AND c.split_file = %s "
+        params.append(split_file)
+    fields = ", ".join(POS_DATA_IMPORT_INVOICE_FIELDS)
+    frappe.db.sql_ddl(f"DROP TEMPORARY TABLE IF EXISTS `{MASTER_DATA_TEMP_TABLE}`")
+    try:
+        frappe.db.sql(f"""
+            CREATE TEMPORARY TABLE `{MASTER_DATA_TEMP_TABLE}` (
+                seq INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                KEY receipt (market_id, pos_no, current_year, receipt_no)
+            ) ENGINE=InnoDB
+            {MASTER_DATA_CHECK_CTE.format(extra_where=extra_where, items_column="NULL AS items")}
+            SELECT {fields}
+            FROM pos_invoice
+            ORDER BY market_id, pos_no, current_year, receipt_no
+        """, tuple(params))
+        total_processed = frappe.db.sql(f"SELECT COUNT(*) FROM `{MASTER_DATA_TEMP_TABLE}`", as_list=True)[0][0]
+        if total_processed:
+            insert_master_data_set_based(total_processed, extra_where, params)
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        raise
+    finally:
+        frappe.db.sql_ddl(f"DROP TEMPORARY TABLE IF EXISTS `{MASTER_DATA_TEMP_TABLE}`")
+    return {"status": "Master Data Check Executed", "count": total_processed}
+
+
+def insert_master_data_set_based(total_processed, extra_where, params):
+    now_str = now()
+    user = frappe.session.user
+    fields = ", ".join(POS_DATA_IMPORT_INVOICE_FIELDS)
+    base = allocate_name_block("POS Data Import", total_processed)
+    frappe.db.sql(f"""
+        INSERT IGNORE INTO `tabPOS Data Import` (
+            name, creation, modified, owner, modified_by, docstatus, idx, {fields}
+        )
+        SELECT
+            LPAD(%s + t.seq - 1, 18, '0'), %s, %s, %s, %s, 0, 0,
+            {", ".join(f"t.{field}" for field in POS_DATA_IMPORT_INVOICE_FIELDS)}
+        FROM `{MASTER_DATA_TEMP_TABLE}` t
+    """, (base, now_str, now_str, user, user))
+    frappe.db.sql(f"""
+        INSERT IGNORE INTO `tabPOS Data Import Item` (
+            name, creation, modified, owner, modified_by, docstatus, idx,
+            item_code, barcode, item_description, quantity, rate, amount,
+            discount_value, status, rejected_reason, invoice_pk, row_pk,
+            active_file_income, split_file, parent, parentfield, parenttype
+        )
+        SELECT
+            CONCAT(x.parent, '-', x.row_no), %s, %s, %s, %s, 0, x.row_no,
+            x.item_code, x.barcode, x.item_description, x.quantity, x.rate, x.amount,
+            x.row_discount_value,
+            IF(x.barcode_exists, 'Checked', 'Rejected'),
+            IF(x.barcode_exists, NULL, CONCAT(x.idx, '- Barcode not found in Item')),
+            x.invoice_pk, x.row_pk,
+            x.active_file_income, x.split_file, x.parent, 'items', 'POS Data Import'
+        FROM (
+            SELECT
+                LPAD(%s + t.seq - 1, 18, '0') AS parent,
+                ROW_NUMBER() OVER (PARTITION BY t.seq ORDER BY c.idx_num, c.idx, c.name) AS row_no,
+                EXISTS(SELECT 1 FROM `tabItem Barcode` ib WHERE ib.barcode = c.barcode) AS barcode_exists,
+                c.idx, c.item_code, c.barcode, c.item_description, c.quantity, c.rate, c.amount,
+                c.row_discount_value, c.invoice_pk, c.row_pk,
+                t.active_file_income, t.split_file
+            FROM `tabPOS Data Check` c
+            INNER JOIN `{MASTER_DATA_TEMP_TABLE}` t ON {MASTER_DATA_RECEIPT_JOIN}
+            WHERE c.imported = 0
+            {extra_where}
+        ) x
+    """, (now_str, now_str, user, user, base, *params))
+    frappe.db.sql(f"""
+        UPDATE `tabPOS Data Check` c
+        INNER JOIN `{MASTER_DATA_TEMP_TABLE}` t ON {MASTER_DATA_RECEIPT_JOIN}
+        SET c.imported = 1
+        WHERE c.imported = 0
+        {extra_where}
+    """, tuple(params))
+
+
 def safe_json_loads(raw: Any) -> Union[dict, list, None]:
     if raw is None:
         return None
@@ -1058,62 +1315,223 @@ def create_sales_invoice_from_data_import(split_file_name=None):
     no_of_rows = frappe.db.sql(f"SELECT IFNULL(COUNT(*), 0) FROM `tabPOS Data Import` {conditions}", (tuple(args),), as_list=True)[0][0]
     if no_of_rows == 0:
         return {"status": "No Data in POS Data Import With Master Data Checked Status", "count": no_of_rows}
+    if frappe.db.get_single_value("MCE Integration Setting", "parallel_invoice_creation"):
+        return dispatch_sales_invoice_creation(split_file_name=split_file_name)
     value = create_sales_invoice_from_data_import_execute(split_file_name=split_file_name)
     return value
     
-def create_sales_invoice_from_data_import_execute(split_file_name=None, commit_interval=20):
+WAREHOUSE_INVOICE_LOCK_PREFIX = "mce_invoice_warehouse_lock:"
+WAREHOUSE_INVOICE_QUEUE_PREFIX = "mce_invoice_warehouse_queue:"
+WAREHOUSE_INVOICE_JOB_TIMEOUT = 10000
+
+
+def dispatch_sales_invoice_creation(split_file_name=None):
+    """Send the pending POS Data Imports to one background job per warehouse.
+
+    Each job only takes the POS Profiles of its warehouse and holds a Redis lock
+    on it, so no two jobs post stock to the same warehouse at once. Imports whose
+    POS Profile has no warehouse are rejected by validation anyway and are
+    processed right here.
+    """
+    conditions = "AND split_file = %s" if split_file_name else ""
+    pos_profiles = frappe.db.sql_list(f"""
+        SELECT DISTINCT IFNULL(pos_profile, '')
+        FROM `tabPOS Data Import`
+        WHERE docstatus = 0
+        {conditions}
+    """, (split_file_name,) if split_file_name else ())
+    master_data = MasterDataSnapshot()
+    warehouses = {master_data.get_warehouse(pos_profile) for pos_profile in pos_profiles} - {None}
+    for warehouse in sorted(warehouses):
+        frappe.enqueue(
+            "masar_mce_integration.utils.create_sales_invoice_for_warehouse",
+            warehouse=warehouse,
+            split_file_name=split_file_name,
+            queue="long",
+            timeout=WAREHOUSE_INVOICE_JOB_TIMEOUT,
+            is_async=True,
+            enqueue_after_commit=True,
+            job_id=f"create_sales_invoice_{warehouse}_{split_file_name or 'all'}",
+        )
+
+    result = {"status": "Sales Invoice Creation Dispatched", "warehouses": sorted(warehouses)}
+    without_warehouse = [pos_profile for pos_profile in pos_profiles if not master_data.get_warehouse(pos_profile)]
+    if without_warehouse:
+        result["without_warehouse"] = create_sales_invoice_from_data_import_execute(
+            split_file_name=split_file_name, pos_profiles=without_warehouse
+        )
+    return result
+
+
+def create_sales_invoice_for_warehouse(warehouse, split_file_name=None):
+    """Process the pending POS Data Imports of `split_file_name` whose POS Profile uses `warehouse`.
+
+    The split is queued for the warehouse first. Whichever job holds the
+    warehouse lock processes the queued splits, and checks the queue again after
+    releasing the lock, so a job that finds the warehouse busy can return right
+    away. A split is queued again while new imports arrive for it; imports left
+    as drafts by a pass (rejected, failed or waiting for consolidation) do not
+    count as new.
+    """
+    results = []
+    handled = {}
+    queue_warehouse_split(warehouse, split_file_name)
+    while True:
+        pos_profiles = [
+            name for name, profile in MasterDataSnapshot().pos_profiles.items() if profile.warehouse == warehouse
+        ]
+        if not pos_profiles or not acquire_warehouse_invoice_lock(warehouse):
+            break
+        try:
+            while (split_file := pop_warehouse_split(warehouse)) is not False:
+                pending = set(get_pending_invoice_imports(pos_profiles, split_file))
+                if not pending - handled.get(split_file, set()):
+                    continue
+                handled.setdefault(split_file, set()).update(pending)
+                results.append(create_sales_invoice_from_data_import_execute(
+                    split_file_name=split_file, pos_profiles=pos_profiles
+                ))
+                queue_warehouse_split(warehouse, split_file)
+        finally:
+            release_warehouse_invoice_lock(warehouse)
+        if not has_queued_warehouse_splits(warehouse):
+            break
+    return results
+
+
+def get_pending_invoice_imports(pos_profiles, split_file_name=None):
+    conditions = "AND split_file = %s" if split_file_name else ""
+    return frappe.db.sql_list(f"""
+        SELECT name
+        FROM `tabPOS Data Import`
+        WHERE docstatus = 0
+        AND pos_profile IN %s
+        {conditions}
+    """, (tuple(pos_profiles), split_file_name) if split_file_name else (tuple(pos_profiles),))
+
+
+def queue_warehouse_split(warehouse, split_file_name):
+    frappe.cache().sadd(f"{WAREHOUSE_INVOICE_QUEUE_PREFIX}{warehouse}", split_file_name or "")
+
+
+def pop_warehouse_split(warehouse):
+    """Return the next split file queued for `warehouse`, None for all splits, False when the queue is empty."""
+    split_file = frappe.cache().spop(f"{WAREHOUSE_INVOICE_QUEUE_PREFIX}{warehouse}")
+    if split_file is None:
+        return False
+    if isinstance(split_file, bytes):
+        split_file = split_file.decode()
+    return split_file or None
+
+
+def has_queued_warehouse_splits(warehouse):
+    return bool(frappe.cache().smembers(f"{WAREHOUSE_INVOICE_QUEUE_PREFIX}{warehouse}"))
+
+
+def acquire_warehouse_invoice_lock(warehouse):
+    key = frappe.cache().make_key(f"{WAREHOUSE_INVOICE_LOCK_PREFIX}{warehouse}")
+    return bool(frappe.cache().set(key, frappe.local.site, nx=True, ex=WAREHOUSE_INVOICE_JOB_TIMEOUT))
+
+
+def release_warehouse_invoice_lock(warehouse):
+    frappe.cache().delete_value(f"{WAREHOUSE_INVOICE_LOCK_PREFIX}{warehouse}")
+
+
+POS_VALIDATION_BATCH_SIZE = 2000
+
+def create_sales_invoice_from_data_import_execute(split_file_name=None, commit_interval=20, pos_profiles=None, names=None):
     receipt_type = (1, 2)
     total_processed = 0
     failed = []  
     conditions = "AND tpdi.split_file = %s" if split_file_name else ""
     args = [split_file_name] if split_file_name else []   
+    if pos_profiles:
+        conditions += " AND IFNULL(tpdi.pos_profile, '') IN %s"
+        args.append(tuple(pos_profiles))
+    if names:
+        conditions += " AND tpdi.name IN %s"
+        args.append(tuple(names))
+    master_data = MasterDataSnapshot()
+    stock = StockProjection()
+    consolidate = frappe.db.get_single_value("MCE Integration Setting", "consolidated_invoicing")
+    # Sales receipts waiting for consolidation get their stock checked by
+    # drop_receipts_without_stock, or every run would consume it again.
+    check_stock = not consolidate
     for r in receipt_type:
-        query_args = [r] + args
         pos_data_import = frappe.db.sql(f"""
-            SELECT name
+            SELECT name, receipt_type
             FROM `tabPOS Data Import` tpdi 
             WHERE tpdi.docstatus = 0
-            AND CAST(tpdi.receipt_type AS CHAR) IN %s
+            AND CAST(tpdi.receipt_type AS CHAR) = %s
             {conditions}
             ORDER BY tpdi.posting_date, tpdi.posting_time
-        """, (receipt_type, *args), as_dict=True)
+        """, (r, *args), as_dict=True)
 
         processed_since_commit = 0
 
-        for record in pos_data_import:
-            try:
-                pos_data_import_doc = frappe.get_doc("POS Data Import", record.name)
-                pos_data_import_doc.run_method("validate")
-                if pos_data_import_doc.status == "Master Data Checked":
-                    pos_data_import_doc.run_method("submit")
-                total_processed += 1
-                processed_since_commit += 1
-            except Exception as e:
-                frappe.log_error(
-                    message=f"POS Data Import {record.name} failed: {str(e)}",
-                    title="POS Data Import Execution Error"
-                )
+        for batch in iter_chunks(pos_data_import, POS_VALIDATION_BATCH_SIZE):
+            waiting_returns = []
+            statuses = validate_pos_data_import_batch(
+                [record.name for record in batch], master_data, stock, check_stock
+            )
+            originals = prefetch_original_invoices(
+                [record.name for record in batch if is_return_receipt(record.receipt_type)]
+            )
+            for record in batch:
                 try:
-                    frappe.db.set_value(
-                        "POS Data Import",
-                        record.name,
-                        {
-                            "status": "Rejected",
-                            "rejected_reason": str(e)[:140],
-                        },
-                        update_modified=False,
+                    # Checked sales receipts wait for create_consolidated_sales_invoices,
+                    # returns of receipts it has not posted yet for process_waiting_returns.
+                    waits_for_consolidation = consolidate and not is_return_receipt(record.receipt_type)
+                    waits_for_original = (
+                        consolidate and is_return_receipt(record.receipt_type) and record.name not in originals
                     )
-                except Exception as inner_e:
+                    waits = waits_for_consolidation or waits_for_original
+                    if statuses is None or (statuses.get(record.name) == "Master Data Checked" and not waits):
+                        pos_data_import_doc = frappe.get_doc("POS Data Import", record.name)
+                        pos_data_import_doc.flags.master_data_snapshot = master_data
+                        pos_data_import_doc.flags.stock_projection = stock
+                        pos_data_import_doc.flags.skip_stock_check = not check_stock
+                        pos_data_import_doc.flags.original_invoice = originals.get(record.name)
+                        if statuses is None:
+                            pos_data_import_doc.run_method("validate")
+                        # submit() validates again; the stock of this document is already consumed.
+                        pos_data_import_doc.flags.prevalidated = True
+                        if pos_data_import_doc.status == "Master Data Checked" and not waits:
+                            pos_data_import_doc.run_method("submit")
+                        elif pos_data_import_doc.status == "Master Data Checked" and waits_for_original:
+                            waiting_returns.append(record.name)
+                    elif waits_for_original and statuses.get(record.name) == "Master Data Checked":
+                        waiting_returns.append(record.name)
+                    total_processed += 1
+                    processed_since_commit += 1
+                except Exception as e:
                     frappe.log_error(
-                        f"Failed to set Rejected status for {record.name}: {inner_e}"
+                        message=f"POS Data Import {record.name} failed: {str(e)}",
+                        title="POS Data Import Execution Error"
                     )
+                    try:
+                        frappe.db.set_value(
+                            "POS Data Import",
+                            record.name,
+                            {
+                                "status": "Rejected",
+                                "rejected_reason": str(e)[:140],
+                            },
+                            update_modified=False,
+                        )
+                    except Exception as inner_e:
+                        frappe.log_error(
+                            f"Failed to set Rejected status for {record.name}: {inner_e}"
+                        )
 
-                failed.append(record.name)
-                processed_since_commit += 1
+                    failed.append(record.name)
+                    processed_since_commit += 1
             
-            if processed_since_commit >= commit_interval:
-                frappe.db.commit()
-                processed_since_commit = 0
+                if processed_since_commit >= commit_interval:
+                    frappe.db.commit()
+                    processed_since_commit = 0
+
+            set_returns_waiting_for_original(waiting_returns)
         
         frappe.db.commit()
         
@@ -1123,6 +1541,286 @@ def create_sales_invoice_from_data_import_execute(split_file_name=None, commit_i
         "failed": failed,
     }
 
+def set_returns_waiting_for_original(names):
+    """Leave the return receipts `names` as drafts until their original receipt is consolidated."""
+    if names:
+        frappe.db.bulk_update(
+            "POS Data Import",
+            {name: {"status": "Failed", "rejected_reason": _("Original invoice not found")} for name in names},
+        )
+
+
+def create_consolidated_sales_invoices(before_date=None):
+    """Post the Master Data Checked sales receipts of the days before `before_date` (today by default).
+
+    Receipts are grouped by POS Profile, posting date and payment method and each
+    group becomes one Sales Invoice with one line per item. Before posting,
+    duplicates of registered or earlier receipts are marked DUPLICATE and
+    receipts the warehouse stock cannot cover are rejected. Every posted receipt
+    is kept in POS Consolidation Link and POS Invoice Registry, and marked
+    SUCCESSFUL. Return receipts waiting for one of the posted receipts are
+    processed afterwards. Runs daily from the scheduler when Consolidated Daily
+    Invoicing is enabled.
+    """
+    if not frappe.db.get_single_value("MCE Integration Setting", "consolidated_invoicing"):
+        return
+    receipts = frappe.db.sql("""
+        SELECT name, invoice_pk, pos_profile, posting_date, posting_time, IFNULL(payment_method, '') AS payment_method,
+            receipt_type, total, net_value, discount_value, discount_percent
+        FROM `tabPOS Data Import`
+        WHERE docstatus = 0
+        AND status = 'Master Data Checked'
+        AND posting_date < %s
+        ORDER BY posting_date, posting_time
+    """, (before_date or today(),), as_dict=True)
+    receipts = drop_duplicate_receipts([receipt for receipt in receipts if not is_return_receipt(receipt.receipt_type)])
+
+    master_data = MasterDataSnapshot()
+    receipts = drop_receipts_without_stock(receipts, master_data, StockProjection())
+
+    groups = {}
+    for receipt in receipts:
+        groups.setdefault((receipt.pos_profile, receipt.posting_date, receipt.payment_method), []).append(receipt)
+
+    created = []
+    failed = []
+    for (pos_profile, posting_date, payment_method), group in groups.items():
+        if not master_data.get_customer(pos_profile):
+            # Fails for every receipt, splitting the group would only repeat it.
+            frappe.log_error(f"POS Profile {pos_profile} has no customer", "POS Consolidation Error")
+            failed.extend(receipt.name for receipt in group)
+            continue
+        group_created, group_failed = consolidate_receipts(pos_profile, posting_date, payment_method, group, master_data)
+        created.extend(group_created)
+        failed.extend(group_failed)
+    return {"created": created, "failed": failed, "returns": process_waiting_returns(created)}
+
+
+def drop_duplicate_receipts(receipts):
+    """Mark DUPLICATE the receipts whose invoice_pk is registered or repeats an earlier receipt, return the rest."""
+    invoice_pks = tuple({receipt.invoice_pk for receipt in receipts if receipt.invoice_pk})
+    registered = {}
+    if invoice_pks:
+        registered = {
+            row.name: row
+            for row in frappe.db.sql("""
+                SELECT name, sales_invoice, pos_data_import
+                FROM `tabPOS Invoice Registry`
+                WHERE name IN %s
+            """, (invoice_pks,), as_dict=True)
+        }
+
+    kept = []
+    kept_by_pk = {}
+    duplicates = {}
+    for receipt in receipts:
+        entry = registered.get(receipt.invoice_pk)
+        if entry and entry.pos_data_import != receipt.name:
+            duplicates[receipt.name] = _("DUPLICATE Invoice from {0}").format(
+                entry.pos_data_import or entry.sales_invoice
+            )
+        elif receipt.invoice_pk and receipt.invoice_pk in kept_by_pk:
+            duplicates[receipt.name] = _("DUPLICATE Invoice from {0}").format(kept_by_pk[receipt.invoice_pk])
+        else:
+            if receipt.invoice_pk:
+                kept_by_pk[receipt.invoice_pk] = receipt.name
+            kept.append(receipt)
+
+    if duplicates:
+        frappe.db.bulk_update(
+            "POS Data Import",
+            {name: {"status": "DUPLICATE", "rejected_reason": reason} for name, reason in duplicates.items()},
+        )
+        frappe.db.commit()
+    return kept
+
+
+def drop_receipts_without_stock(receipts, master_data, stock):
+    """Reject the receipts, in posting order, whose items the warehouse stock cannot cover; return the rest."""
+    if not receipts:
+        return []
+    items_by_parent = {}
+    for row in frappe.db.sql("""
+        SELECT parent, idx, barcode, quantity
+        FROM `tabPOS Data Import Item`
+        WHERE parent IN %s
+        ORDER BY parent, idx
+    """, (tuple(receipt.name for receipt in receipts),), as_dict=True):
+        items_by_parent.setdefault(row.parent, []).append(row)
+
+    kept = []
+    rejected = {}
+    for receipt in receipts:
+        warehouse = master_data.get_warehouse(receipt.pos_profile)
+        items = items_by_parent.get(receipt.name, [])
+        if warehouse:
+            item_codes = {get_item_code_for_barcode(row.barcode) for row in items} - {None}
+            not_available = get_stock_errors(items, stock.load(warehouse, item_codes))
+            if not_available:
+                rejected[receipt.name] = ", ".join(not_available)
+                continue
+            stock.consume(warehouse, items)
+        kept.append(receipt)
+
+    if rejected:
+        frappe.db.bulk_update(
+            "POS Data Import",
+            {name: {"status": "Rejected", "rejected_reason": reason} for name, reason in rejected.items()},
+        )
+        frappe.db.commit()
+    return kept
+
+
+def consolidate_receipts(pos_profile, posting_date, payment_method, receipts, master_data):
+    """Post `receipts` in one consolidated Sales Invoice.
+
+    When posting fails the receipts are split in halves and posted again, so a
+    failing receipt ends up alone and is rejected without holding back the rest
+    of its group. Returns (created Sales Invoices, rejected POS Data Imports).
+    """
+    try:
+        sales_invoice = create_consolidated_sales_invoice(pos_profile, posting_date, payment_method, receipts, master_data)
+        frappe.db.commit()
+        return [sales_invoice], []
+    except Exception as e:
+        frappe.db.rollback()
+        if len(receipts) == 1:
+            frappe.log_error(frappe.get_traceback(), f"POS Consolidation Error: {receipts[0].name}")
+            frappe.db.set_value(
+                "POS Data Import",
+                receipts[0].name,
+                {
+                    "status": "Rejected",
+                    "rejected_reason": _("Failed to consolidate: {0}").format(str(e))[:140],
+                },
+                update_modified=False,
+            )
+            frappe.db.commit()
+            return [], [receipts[0].name]
+
+    half = len(receipts) // 2
+    first_created, first_failed = consolidate_receipts(
+        pos_profile, posting_date, payment_method, receipts[:half], master_data
+    )
+    second_created, second_failed = consolidate_receipts(
+        pos_profile, posting_date, payment_method, receipts[half:], master_data
+    )
+    return first_created + second_created, first_failed + second_failed
+
+
+def process_waiting_returns(sales_invoices):
+    """Process the returns waiting for a receipt that was consolidated in one of `sales_invoices`."""
+    if not sales_invoices:
+        return []
+    names = frappe.db.sql_list("""
+        SELECT DISTINCT pdi.name
+        FROM `tabPOS Consolidation Link` link
+        INNER JOIN `tabPOS Data Import` pdi
+            ON pdi.market_id = link.market_id
+            AND pdi.refund_receipt_pos_no = link.pos_no
+            AND pdi.refund_receipt_no = link.receipt_no
+        WHERE link.sales_invoice IN %s
+        AND pdi.docstatus = 0
+        AND pdi.status = 'Failed'
+        AND pdi.rejected_reason = %s
+    """, (tuple(sales_invoices), _("Original invoice not found")))
+    return [
+        create_sales_invoice_from_data_import_execute(names=batch)
+        for batch in iter_chunks(names, POS_VALIDATION_BATCH_SIZE)
+    ]
+
+
+def create_consolidated_sales_invoice(pos_profile, posting_date, payment_method, receipts, master_data):
+    names = tuple(receipt.name for receipt in receipts)
+    items = frappe.db.sql("""
+        SELECT
+            COALESCE(NULLIF(i.item_code, ''), ib.parent) AS item_code,
+            SUM(i.quantity) AS quantity,
+            SUM(i.amount) AS amount,
+            SUM(i.discount_value) AS discount_value
+        FROM `tabPOS Data Import Item` i
+        LEFT JOIN `tabItem Barcode` ib ON ib.barcode = i.barcode
+        WHERE i.parent IN %s
+        GROUP BY COALESCE(NULLIF(i.item_code, ''), ib.parent)
+        ORDER BY item_code
+    """, (names,), as_dict=True)
+
+    warehouse = master_data.get_warehouse(pos_profile)
+    si = frappe.new_doc("Sales Invoice")
+    si.is_pos = 1
+    si.pos_profile = pos_profile
+    si.set_posting_time = 1
+    si.disable_rounded_total = 1
+    si.posting_date = posting_date
+    si.posting_time = max(receipt.posting_time for receipt in receipts)
+    si.customer = master_data.get_customer(pos_profile)
+    si.update_stock = 1
+    if warehouse:
+        si.set_warehouse = warehouse
+    si.remarks = _("Consolidated from {0} POS receipts").format(len(names))
+    # Receipt level discounts, as ERPNext applies them: the percentage wins over the amount.
+    discount_amount = sum(
+        flt(receipt.total) * flt(receipt.discount_percent) / 100 if flt(receipt.discount_percent)
+        else flt(receipt.discount_value)
+        for receipt in receipts
+    )
+    if discount_amount:
+        si.discount_amount = discount_amount
+    for row in items:
+        qty = flt(row.quantity)
+        amount = flt(row.amount)
+        rate = flt(amount / qty) if qty else 0.0
+        discount_pct = (flt(row.discount_value) / (rate * qty)) * 100 if rate and qty else 0.0
+        si.append("items", {
+            "item_code": row.item_code,
+            "qty": qty,
+            "price_list_rate": rate + (flt(row.discount_value) / qty if qty else 0.0),
+            "rate": rate,
+            "discount_percentage": flt(discount_pct),
+        })
+    si.insert()
+    payment_amount = sum(flt(receipt.net_value) for receipt in receipts) or flt(si.grand_total)
+    if payment_method:
+        si.append("payments", {
+            "mode_of_payment": payment_method,
+            "amount": payment_amount
+        })
+    si.save()
+    si.submit()
+
+    link_consolidated_receipts(si.name, names)
+    register_consolidated_invoice(si.name, names)
+    frappe.db.sql("""
+        UPDATE `tabPOS Data Import` other
+        INNER JOIN `tabPOS Data Import` posted
+            ON posted.invoice_pk = other.invoice_pk AND posted.name IN %(names)s
+        SET other.status = 'DUPLICATE',
+            other.rejected_reason = CONCAT('New Import ', posted.name, ' has been submitted for this Invoice')
+        WHERE other.docstatus = 0
+        AND other.name NOT IN %(names)s
+        AND IFNULL(other.invoice_pk, '') != ''
+    """, {"names": names})
+    frappe.db.sql("""
+        UPDATE `tabPOS Data Import`
+        SET docstatus = 1, status = 'SUCCESSFUL', rejected_reason = '', modified = %s
+        WHERE name IN %s
+    """, (now(), names))
+    frappe.db.sql("UPDATE `tabPOS Data Import Item` SET docstatus = 1 WHERE parent IN %s", (names,))
+    set_pos_data_checks_successful(names)
+    return si.name
+
+
+def validate_pos_data_import_batch(names, master_data, stock, check_stock=True):
+    """Validate `names` together, returns {name: status} or None when each one has to validate itself."""
+    try:
+        statuses = validate_pos_data_imports(names, master_data, stock, check_stock)
+        frappe.db.commit()
+        return statuses
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), "POS Data Import Batch Validation Error")
+        return None
+
 def cleanup_pos_tables_for_split_file(split_file):
     if not split_file:
         return
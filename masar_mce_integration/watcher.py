@@ -0,0 +1,171 @@
+import frappe, os, time, select, struct, ctypes, ctypes.util
+from masar_mce_integration.tasks import (
+    check_active_paths, create_active_file_income, get_done_marker, get_marked_file, remove_done_marker,
+    DONE_MARKER_SUFFIX, INGESTION_SIZE_STABILITY, INGESTION_DONE_MARKER
+)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 64 * 1024
+WATCHER_POLL_INTERVAL = 60
+
+
+def run_active_path_watcher(poll_interval=WATCHER_POLL_INTERVAL):
+    """Create Active File Income records as soon as files land in the active path.
+
+    Meant to run as its own long-lived process next to the bench workers, e.g. a
+    supervisor program running:
+
+        bench --site <site> execute masar_mce_integration.watcher.run_active_path_watcher
+
+    Uses Linux inotify (IN_CLOSE_WRITE / IN_MOVED_TO) so a file is picked up the
+    moment its writer closes it or it is moved in; in Done Marker ingestion mode
+    it is picked up when its `.done` marker arrives instead. Where inotify is
+    unavailable it falls back to calling check_active_paths every `poll_interval`
+    seconds. The
+    settings are re-read on every timeout, so changing the active path or
+    disabling the integration takes effect without a restart.
+    """
+    poll_interval = int(poll_interval or WATCHER_POLL_INTERVAL)
+    watched_path = None
+    fd = None
+    try:
+        while True:
+            settings = get_watcher_settings()
+            active_path = settings.active_file_path if settings else None
+            if active_path != watched_path:
+                close_inotify(fd)
+                fd = None
+                watched_path = active_path
+                if active_path:
+                    fd = open_inotify(active_path)
+                    frappe.logger().info(
+                        f"MCE watcher on {active_path} using {'inotify' if fd is not None else 'polling'}"
+                    )
+                    run_active_path_scan()
+            if not active_path:
+                time.sleep(poll_interval)
+                continue
+            if fd is None:
+                run_active_path_scan()
+                time.sleep(poll_interval)
+                continue
+            events = read_inotify_events(fd, poll_interval)
+            if events is None:
+                close_inotify(fd)
+                fd = None
+                watched_path = None
+                continue
+            handle_watcher_events(events, active_path, settings)
+    finally:
+        close_inotify(fd)
+
+
+def get_watcher_settings():
+    try:
+        frappe.db.commit()
+        settings = frappe.get_single("MCE Integration Setting")
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "MCE Watcher Settings Error")
+        return None
+    if getattr(settings, "disabled", 0) == 1:
+        return None
+    if not settings.active_file_path or not os.path.isdir(settings.active_file_path):
+        return None
+    return settings
+
+
+def run_active_path_scan():
+    try:
+        check_active_paths()
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), "MCE Watcher Scan Error")
+
+
+def handle_watcher_events(events, active_path, settings):
+    batch_size = int(getattr(settings, "batch_size", 1000) or 1000)
+    ingestion_mode = getattr(settings, "ingestion_mode", None) or INGESTION_SIZE_STABILITY
+    for mask, file in events:
+        if mask & IN_Q_OVERFLOW:
+            run_active_path_scan()
+            continue
+        file_path = os.path.join(active_path, file)
+        done_marker = None
+        if ingestion_mode == INGESTION_DONE_MARKER:
+            if file.lower().endswith(DONE_MARKER_SUFFIX):
+                done_marker = file_path
+                file_path = get_marked_file(file_path)
+            elif file.lower().endswith(".json"):
+                done_marker = get_done_marker(file_path)
+            if not file_path or not done_marker:
+                continue
+        elif not file.lower().endswith(".json"):
+            continue
+        if not os.path.isfile(file_path):
+            continue
+        try:
+            create_active_file_income(os.path.basename(file_path), active_path, batch_size)
+            remove_done_marker(done_marker)
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), f"MCE Watcher File Error: {file}")
+
+
+def open_inotify(path):
+    """Return an inotify descriptor watching `path`, or None when unsupported."""
+    libc_name = ctypes.util.find_library("c")
+    if not libc_name:
+        return None
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        inotify_init1 = libc.inotify_init1
+        inotify_add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        return None
+    if inotify_add_watch(fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def read_inotify_events(fd, timeout):
+    """Wait up to `timeout` seconds and return [(mask, file name)].
+
+    Returns None when the watch is gone (e.g. the directory was removed).
+    """
+    ready, _, _ = select.select([fd], [], [], timeout)
+    if not ready:
+        return []
+    try:
+        data = os.read(fd, INOTIFY_READ_SIZE)
+    except BlockingIOError:
+        return []
+    events = []
+    offset = 0
+    while offset + INOTIFY_EVENT.size <= len(data):
+        _wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        name = data[offset:offset + length].rstrip(b"\0")
+        offset += length
+        if mask & IN_IGNORED:
+            return None
+        events.append((mask, os.fsdecode(name)))
+    return events
+
+
+def close_inotify(fd):
+    if fd is None:
+        return
+    try:
+        os.close(fd)
+    except OSError:
+        pass